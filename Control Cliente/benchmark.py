@@ -0,0 +1,164 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+
+# ------------------------------
+# BENCHMARK DE LAS ETAPAS
+# ------------------------------
+# Tamaños del archivo CONTROL (facturas en total) que se miden por defecto
+TAMANOS = [1000, 10000, 100000, 500000]
+
+# Cada tamaño corre en su propio proceso con la carpeta sintetica como directorio de trabajo,
+# porque main.py fija sus rutas con os.getcwd() al importarse
+CARPETA_PROGRAMA = os.path.dirname(os.path.abspath(__file__))
+
+
+def _silencio(mensaje):
+    pass
+
+
+def _medir(tiempos, nombre, funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    tiempos[nombre] = round(time.perf_counter() - inicio, 3)
+    return resultado
+
+
+def medir_tamano(facturas, semilla=1):
+    # Se ejecuta dentro de la carpeta sintetica (vacia) de este tamaño
+    from datos_sinteticos import generar_escenario
+    import main
+
+    tiempos = {}
+    escenario = _medir(tiempos, "generar_datos", generar_escenario, os.getcwd(), facturas, semilla)
+
+    staging_control = os.path.join(main.NORMALIZANDO_DIR, "control")
+    staging_pago = os.path.join(main.NORMALIZANDO_DIR, "pago")
+    os.makedirs(staging_control, exist_ok=True)
+    os.makedirs(staging_pago, exist_ok=True)
+
+    ruta_control, df_control = _medir(
+        tiempos, "ajustar_formato_archivo_control",
+        main.ajustar_formato_archivo_control, escenario["entrada_control"], carpeta_destino=staging_control
+    )
+    ruta_pago = _medir(
+        tiempos, "ajustar_formato_archivo_pago",
+        main.ajustar_formato_archivo_pago, escenario["entrada_pago"], "2025-12-10",
+        log_callback=_silencio, carpeta_destino=staging_pago
+    )
+
+    errores = []
+    archivo_control = main.obtener_ruta_control_por_anio(escenario["anio"])
+    control = _medir(
+        tiempos, "agregar_control",
+        main.agregar_control, archivo_control, df_control,
+        log_callback=_silencio, errores_detallados=errores, origen=escenario["entrada_control"]
+    )
+    pagos = _medir(
+        tiempos, "agregar_pago",
+        main.agregar_pago, ruta_pago, log_callback=_silencio, errores_detallados=errores
+    )
+    _medir(tiempos, "crear_copia_seguridad", main.crear_copia_seguridad, log_callback=_silencio)
+
+    # La primera llamada arma el indice; la segunda mide el reporte sin cambios en los CONTROL
+    _medir(tiempos, "FacturasNoPagadas", main.FacturasNoPagadas, abrir=False)
+    _medir(tiempos, "FacturasNoPagadas_sin_cambios", main.FacturasNoPagadas, abrir=False)
+
+    log_negrita = _medir(tiempos, "actualizar_control_manualmente", main.actualizar_control_manualmente, main.CONTROL_DIR)
+    _medir(tiempos, "marcar_pagadas_desde_log", main.marcar_pagadas_desde_log, log_negrita)
+
+    return {
+        "facturas": facturas,
+        "filas_entrada": escenario["filas_entrada"],
+        "filas_agregadas": control["filas_agregadas"],
+        "filas_omitidas": control["filas_omitidas"],
+        "facturas_pagadas": pagos["facturas_actualizadas"],
+        "filas_negrita": len(log_negrita),
+        "errores": len(errores),
+        "tiempos": tiempos,
+    }
+
+
+def _commit_actual():
+    try:
+        salida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=CARPETA_PROGRAMA,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return salida.stdout.strip() or None
+
+
+def ejecutar_benchmark(tamanos, carpeta_trabajo, semilla=1, log_callback=print):
+    resultados = []
+    fallas = []
+    for facturas in tamanos:
+        carpeta = os.path.join(carpeta_trabajo, f"facturas_{facturas}")
+        shutil.rmtree(carpeta, ignore_errors=True)
+        os.makedirs(carpeta)
+        ruta_resultado = os.path.join(carpeta_trabajo, f"resultado_{facturas}.json")
+
+        log_callback(f"Midiendo {facturas} facturas...")
+        proceso = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--medir", str(facturas),
+             "--semilla", str(semilla), "--resultado", ruta_resultado],
+            cwd=carpeta, capture_output=True, text=True
+        )
+        if proceso.returncode != 0:
+            fallas.append({"facturas": facturas, "error": proceso.stderr.strip().splitlines()[-1:]})
+            log_callback(f"[ERROR] {facturas} facturas: {proceso.stderr.strip()}")
+            continue
+
+        with open(ruta_resultado, encoding="utf-8") as f:
+            resultado = json.load(f)
+        resultados.append(resultado)
+        log_callback(f"{facturas} facturas: {resultado['tiempos']}")
+
+    return resultados, fallas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide cada etapa del programa sobre datos sinteticos")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS, help="Facturas en los CONTROL generados")
+    parser.add_argument("--salida", help="JSON de resultados (por defecto benchmark_<fecha>.json)")
+    parser.add_argument("--carpeta", help="Carpeta de trabajo para los datos; sin ella se usa una temporal que se borra al terminar")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--medir", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--resultado", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Proceso hijo: mide un tamaño en el directorio actual
+    if args.medir is not None:
+        resultado = medir_tamano(args.medir, args.semilla)
+        with open(args.resultado, "w", encoding="utf-8") as f:
+            json.dump(resultado, f)
+        sys.exit(0)
+
+    carpeta_trabajo = args.carpeta or tempfile.mkdtemp(prefix="benchmark_control_")
+    os.makedirs(carpeta_trabajo, exist_ok=True)
+    try:
+        resultados, fallas = ejecutar_benchmark(args.tamanos, carpeta_trabajo, args.semilla)
+    finally:
+        if args.carpeta is None:
+            shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+
+    salida = args.salida or f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump({
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit_actual(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "procesadores": os.cpu_count(),
+            "resultados": resultados,
+            "fallas": fallas,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"Resultados en {salida}")
+    sys.exit(1 if fallas else 0)
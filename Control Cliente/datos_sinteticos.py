@@ -0,0 +1,176 @@
+import os
+import random
+import argparse
+import pandas as pd
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
+from openpyxl.styles import PatternFill, Alignment, Font
+
+from main import MESES_ES, ENCABEZADOS_CONTROL, COLORES_ESTADO, MARGEN_ANCHO_COLUMNA, celda_con_estilo
+
+
+# ------------------------------
+# DATOS SINTETICOS
+# ------------------------------
+# Arbol de carpetas que espera main.py, relativo a la carpeta del programa
+CARPETAS = ["CONTROL", "Agregar control", "Agregar pago", "FacturasNoPagadas",
+            os.path.join("Data", "Copias de seguridad"), os.path.join("Data", "Historial control"),
+            os.path.join("Data", "Historial pagos")]
+
+# Proporcion de cada estado en los CONTROL generados
+PROPORCION_ESTADOS = [("PAGADO", 0.55), ("DIFERENCIA", 0.15), ("NO PAGADO", 0.30)]
+
+# Filas en negrita (marcadas para pagar a mano) por cada factura
+PROPORCION_NEGRITA = 0.002
+
+PRIMER_NUMERO = 100000
+
+
+def _estado_aleatorio(rnd):
+    r = rnd.random()
+    for estado, proporcion in PROPORCION_ESTADOS:
+        if r < proporcion:
+            return estado
+        r -= proporcion
+    return PROPORCION_ESTADOS[-1][0]
+
+
+def anios_para(facturas):
+    # Un año por cada ~100k facturas (hasta 10), terminando en 2025
+    cantidad = max(1, min(10, -(-facturas // 100000)))
+    return list(range(2025 - cantidad + 1, 2026))
+
+
+def generar_arbol(base, facturas, anios=None, semilla=1, proporcion_negrita=PROPORCION_NEGRITA):
+    # Crea CONTROL/<anio>/CONTROL_<anio>.xlsx con las facturas repartidas por año y mes.
+    # Devuelve las facturas no pagadas como (fecha, numero, monto) para armar pagos
+    rnd = random.Random(semilla)
+    anios = anios or anios_para(facturas)
+    for carpeta in CARPETAS:
+        os.makedirs(os.path.join(base, carpeta), exist_ok=True)
+
+    alineacion = Alignment(horizontal="center", vertical="center")
+    no_pagadas = []
+    numero = PRIMER_NUMERO
+    meses = len(anios) * 12
+    for i_anio, anio in enumerate(anios):
+        wb = Workbook(write_only=True)
+        estilos = {}
+
+        def estilo(estado, negrita):
+            if (estado, negrita) not in estilos:
+                estilos[(estado, negrita)] = {"alignment": alineacion}
+                if estado:
+                    color = COLORES_ESTADO[estado]
+                    estilos[(estado, negrita)]["fill"] = PatternFill(start_color=color, end_color=color, fill_type="solid")
+                if negrita:
+                    estilos[(estado, negrita)]["font"] = Font(bold=True)
+            return estilos[(estado, negrita)]
+
+        for mes, mes_nombre in MESES_ES.items():
+            # Reparto parejo, el resto va a los primeros meses
+            indice_mes = i_anio * 12 + mes - 1
+            cantidad = facturas // meses + (1 if indice_mes < facturas % meses else 0)
+            ws = wb.create_sheet(mes_nombre)
+
+            filas = []
+            for i in range(cantidad):
+                numero += 1
+                monto = rnd.randint(100, 50000)
+                estado = _estado_aleatorio(rnd)
+                fecha = f"{i % 28 + 1:02d}/{mes:02d}/{anio}"
+                if estado == "PAGADO":
+                    fila = [fecha, f"A{numero}", monto, monto, f"10/{mes:02d}/{anio}", estado]
+                elif estado == "DIFERENCIA":
+                    fila = [fecha, f"A{numero}", monto, int(monto * rnd.uniform(0.3, 0.95)), f"10/{mes:02d}/{anio}", estado]
+                else:
+                    fila = [fecha, f"A{numero}", monto, 0, "-", estado]
+                    no_pagadas.append((fecha, f"A{numero}", monto))
+                filas.append(fila)
+
+            # En write-only los anchos van antes de las filas
+            anchos = [len(h) for h in ENCABEZADOS_CONTROL]
+            for fila in filas:
+                for idx, valor in enumerate(fila):
+                    anchos[idx] = max(anchos[idx], len(str(valor)))
+            for idx, ancho in enumerate(anchos, start=1):
+                ws.column_dimensions[get_column_letter(idx)].width = ancho + MARGEN_ANCHO_COLUMNA
+
+            encabezado = []
+            for valor in ENCABEZADOS_CONTROL:
+                cell = WriteOnlyCell(ws, value=valor)
+                cell.alignment = alineacion
+                encabezado.append(cell)
+            ws.append(encabezado)
+
+            for fila in filas:
+                estilo_fila = estilo(fila[5], rnd.random() < proporcion_negrita)
+                ws.append([celda_con_estilo(ws, valor, estilo_fila) for valor in fila])
+
+        carpeta_anio = os.path.join(base, "CONTROL", str(anio))
+        os.makedirs(carpeta_anio, exist_ok=True)
+        wb.save(os.path.join(carpeta_anio, f"CONTROL_{anio}.xlsx"))
+
+    return no_pagadas
+
+
+def generar_entrada_control(ruta, facturas, anio, mes, primer_numero, duplicados=(), semilla=1):
+    # Archivo de "Agregar control" con las columnas del sistema de facturacion.
+    # duplicados: numeros (sin la A) que ya estan en el CONTROL y deben informarse
+    rnd = random.Random(semilla)
+    numeros = list(range(primer_numero, primer_numero + facturas)) + list(duplicados)
+    df = pd.DataFrame({
+        "Cliente": "CLIENTE SINTETICO",
+        "Tipodocum": "101",
+        "Documento": "e-Factura",
+        "Serie": "A",
+        "Fecha": [f"{rnd.randint(1, 28):02d}/{mes:02d}/{anio}" for _ in numeros],
+        "Cfe_serie": "A",
+        "Cfe_numero": numeros,
+        "Importe": [rnd.randint(100, 50000) for _ in numeros],
+        "Moneda": "UYU",
+    })
+    df.to_excel(ruta, index=False)
+    return ruta
+
+
+def generar_pago(ruta, no_pagadas, facturas, semilla=1):
+    # Archivo de "Agregar pago" con facturas pendientes del arbol: la mayoria pagadas
+    # completas y el resto con diferencia. La quinta columna se descarta al normalizar
+    rnd = random.Random(semilla)
+    elegidas = rnd.sample(no_pagadas, min(facturas, len(no_pagadas)))
+    filas = []
+    for fecha, numero, monto in elegidas:
+        pagado = monto if rnd.random() < 0.8 else int(monto * rnd.uniform(0.3, 0.95))
+        filas.append([fecha, numero, monto, pagado, "Transferencia"])
+    pd.DataFrame(filas, columns=["FECHA", "NUMERO", "MONTO", "PAGADO", "MEDIO"]).to_excel(ruta, index=False)
+    return ruta
+
+
+def generar_escenario(base, facturas, semilla=1):
+    # Arbol CONTROL + un archivo de cada entrada con ~2% del tamaño del archivo
+    no_pagadas = generar_arbol(base, facturas, semilla=semilla)
+    anio = anios_para(facturas)[-1]
+    tamano_entrada = max(50, facturas // 50)
+    ruta_control = generar_entrada_control(
+        os.path.join(base, "Agregar control", "control_sintetico.xlsx"),
+        tamano_entrada, anio, 12, PRIMER_NUMERO + facturas + 1,
+        duplicados=[PRIMER_NUMERO + facturas - i for i in range(min(10, facturas))], semilla=semilla
+    )
+    ruta_pago = generar_pago(
+        os.path.join(base, "Agregar pago", "pago_sintetico.xlsx"), no_pagadas, tamano_entrada, semilla=semilla
+    )
+    return {"anio": anio, "entrada_control": ruta_control, "entrada_pago": ruta_pago,
+            "filas_entrada": tamano_entrada, "no_pagadas": len(no_pagadas)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera un arbol CONTROL y archivos de entrada sinteticos")
+    parser.add_argument("carpeta", help="Carpeta donde crear el arbol (como la carpeta del programa)")
+    parser.add_argument("--facturas", type=int, default=10000, help="Facturas en los CONTROL (1000 a 500000)")
+    parser.add_argument("--semilla", type=int, default=1)
+    args = parser.parse_args()
+    resumen = generar_escenario(args.carpeta, args.facturas, args.semilla)
+    print(resumen)
@@ -1,15 +1,25 @@
 import os
+import re
 import sys
 import glob
+import json
+import time
+import argparse
 import shutil
-import locale
-import calendar
+import sqlite3
+import hashlib
+import numpy as np
 import pandas as pd
 import customtkinter as ctk
 
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, date, time as hora, timedelta
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from tkinter import scrolledtext
 from openpyxl import load_workbook, Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 from openpyxl.styles import PatternFill, Alignment, Font
 
 
@@ -29,6 +39,11 @@ HISTORIAL_CONTROL_DIR = os.path.join(DATA_DIR, "Historial control")
 AYUDA_DIR = os.path.join(DATA_DIR, "Textos de ayuda")
 FACTURASNOPAGADAS_DIR = os.path.join(BASE_DIR, "FacturasNoPagadas")
 OUTPUT_FILE_FACTURASNOPAGADAS = os.path.join(BASE_DIR, "FacturasNoPagadas", "FacturasNoPagadas.xlsx")
+INDICE_DB = os.path.join(DATA_DIR, "control_index.db")
+LIBRO_MAYOR_DIR = os.path.join(DATA_DIR, "Libro mayor")
+CARPETA_COPIA_LIBRO_MAYOR = "Libro mayor"  # Subcarpeta de cada copia de seguridad
+NORMALIZANDO_DIR = os.path.join(DATA_DIR, "Normalizando")
+REGISTROS_DIR = os.path.join(DATA_DIR, "Registros")
 CONTROL_FILE = os.path.join(CONTROL_DIR, "control.xlsx")
 ARCHIVO_CONTROL = os.path.join(CONTROL_DIR, "CONTROL.xlsx")
 
@@ -41,6 +56,33 @@ COLOR_NO_PAGADO = PatternFill(start_color="FF0000", end_color="FF0000", fill_typ
 
 
 
+# Almacenamiento de las facturas:
+#   "excel"   -> los CONTROL_<anio>.xlsx son la base de datos (modo de siempre)
+#   "parquet" -> libro mayor en Data/Libro mayor/<anio>/<MES>.parquet y los CONTROL se
+#                regeneran como vista. Requiere pyarrow
+MODO_ALMACENAMIENTO = os.environ.get("CONTROL_ALMACENAMIENTO", "excel").strip().lower()
+
+
+
+# Procesos para normalizar en paralelo los archivos de "Agregar control" y "Agregar pago"
+MAX_PROCESOS_NORMALIZACION = os.cpu_count() or 1
+
+
+
+# Copias de seguridad
+COPIAS_INCREMENTALES = True  # Los archivos sin cambios se enlazan a la copia anterior
+MAX_COPIAS = 15
+MAX_COPIAS_INCREMENTALES = 120
+
+
+
+# Estado de cada factura (columna ESTADO de los CONTROL) y el color que le corresponde a la fila
+COLUMNAS_FACTURA = ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"]
+ENCABEZADOS_CONTROL = COLUMNAS_FACTURA + ["ESTADO"]
+COLORES_ESTADO = {"PAGADO": "93c47d", "DIFERENCIA": "f6b26b", "NO PAGADO": "FF4040", "MANUAL": "93c47d"}
+
+
+
 # Diccionario para traducir meses a español
 MESES_ES = {
     1: "ENERO", 2: "FEBRERO", 3: "MARZO", 4: "ABRIL",
@@ -58,15 +100,260 @@ def default_log(msg):
 
 
 
+# ------------------------------
+# TRAZA DE EJECUCION
+# ------------------------------
+# Trazas que se conservan en Data/Registros (las mas viejas se borran)
+MAX_TRAZAS = 100
+
+# Traza de la ejecucion en curso; sin traza los tramos solo miden su duracion
+_TRAZA = None
+
+
+def _texto_tramo(segundos, datos):
+    partes = [f"{segundos:.3f} s"]
+    if datos.get("filas"):
+        partes.append(f"{datos['filas']} filas")
+    if datos.get("bytes_leidos"):
+        partes.append(f"{datos['bytes_leidos'] / 1048576:.1f} MB leidos")
+    if datos.get("bytes_escritos"):
+        partes.append(f"{datos['bytes_escritos'] / 1048576:.1f} MB escritos")
+    return ", ".join(partes)
+
+
+class Traza:
+    def __init__(self, log_callback=None):
+        self.log = log_callback
+        self.fecha = datetime.now()
+        self.inicio = time.perf_counter()
+        self.tramos = []
+        self.profundidad = 0
+
+    def registrar(self, nombre, inicio, duracion, nivel, datos):
+        self.tramos.append({"nombre": nombre, "inicio": inicio - self.inicio, "duracion": duracion,
+                            "nivel": nivel, **datos})
+        # Las etapas van al log en el momento; las llamadas internas se resumen al final
+        if nivel == 0 and self.log:
+            self.log(f"[TIEMPO] {nombre}: {_texto_tramo(duracion, datos)}")
+
+    def resumen(self):
+        # Totales de las llamadas internas (load_workbook, save, read_excel...) por nombre
+        totales = {}
+        for t in self.tramos:
+            if t["nivel"] == 0:
+                continue
+            total = totales.setdefault(t["nombre"], {"llamadas": 0, "segundos": 0.0, "filas": 0,
+                                                     "bytes_leidos": 0, "bytes_escritos": 0})
+            total["llamadas"] += 1
+            total["segundos"] += t["duracion"]
+            for clave in ("filas", "bytes_leidos", "bytes_escritos"):
+                total[clave] += t.get(clave) or 0
+        for total in totales.values():
+            total["segundos"] = round(total["segundos"], 3)
+        return totales
+
+    def registrar_resumen(self):
+        if not self.log:
+            return
+        for nombre, total in sorted(self.resumen().items(), key=lambda x: -x[1]["segundos"]):
+            self.log(f"[TIEMPO]   {nombre} ({total['llamadas']} llamadas): {_texto_tramo(total['segundos'], total)}")
+
+    def guardar(self, carpeta=REGISTROS_DIR):
+        # Formato Chrome trace (chrome://tracing o ui.perfetto.dev); "otherData" lleva el resumen
+        os.makedirs(carpeta, exist_ok=True)
+        eventos = []
+        for t in self.tramos:
+            eventos.append({
+                "name": t["nombre"],
+                "cat": "etapa" if t["nivel"] == 0 else "io",
+                "ph": "X",
+                "ts": round(t["inicio"] * 1e6),
+                "dur": round(t["duracion"] * 1e6),
+                "pid": os.getpid(),
+                "tid": 1,
+                "args": {k: v for k, v in t.items() if k not in ("nombre", "inicio", "duracion", "nivel")},
+            })
+        ruta = obtener_ruta_disponible(os.path.join(carpeta, f"traza_{self.fecha.strftime('%Y%m%d_%H%M%S')}.json"))
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump({
+                "traceEvents": eventos,
+                "otherData": {"fecha": self.fecha.isoformat(timespec="seconds"), "resumen": self.resumen()},
+            }, f, ensure_ascii=False, default=str)
+
+        trazas = sorted(glob.glob(os.path.join(carpeta, "traza_*.json")))
+        for vieja in trazas[:-MAX_TRAZAS]:
+            os.remove(vieja)
+        return ruta
+
+
+@contextmanager
+def tramo(nombre, **datos):
+    # Mide un bloque de la ejecucion. El bloque puede completar datos["filas"], datos["bytes_leidos"]
+    # y datos["bytes_escritos"]; al salir datos["segundos"] tiene la duracion
+    traza = _TRAZA
+    inicio = time.perf_counter()
+    if traza is not None:
+        traza.profundidad += 1
+    try:
+        yield datos
+    finally:
+        duracion = time.perf_counter() - inicio
+        datos["segundos"] = round(duracion, 3)
+        if traza is not None:
+            traza.profundidad -= 1
+            traza.registrar(nombre, inicio, duracion, traza.profundidad, datos)
+
+
+def leer_excel(ruta, **kwargs):
+    with tramo("read_excel", archivo=os.path.basename(ruta), bytes_leidos=os.path.getsize(ruta)) as datos:
+        df = pd.read_excel(ruta, **kwargs)
+        datos["filas"] = len(df)
+    return df
+
+
+def abrir_libro(ruta, **kwargs):
+    with tramo("load_workbook", archivo=os.path.basename(ruta), bytes_leidos=os.path.getsize(ruta)):
+        return load_workbook(ruta, **kwargs)
+
+
+def guardar_libro(wb, ruta):
+    with tramo("save", archivo=os.path.basename(ruta)) as datos:
+        wb.save(ruta)
+        datos["bytes_escritos"] = os.path.getsize(ruta)
+
+
+
+
+# ------------------------------
+# PERFIL DE EJECUCION (opcional)
+# ------------------------------
+# Con CONTROL_PERFIL=1 (o "run --profile") la corrida se perfila con cProfile y tracemalloc.
+# Apagado no se importa ni se activa nada
+PERFIL_ACTIVO = os.environ.get("CONTROL_PERFIL", "").strip().lower() in ("1", "si", "true")
+
+# Funciones y lineas de asignacion que se listan en el reporte
+TOP_PERFIL = 30
+
+
+def perfilar(funcion, *args, **kwargs):
+    # Corre funcion(*args, **kwargs) perfilada; devuelve (resultado, perfil). El .pstats y el
+    # reporte de memoria quedan en Data/Registros junto a la traza de la corrida
+    import io
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    os.makedirs(REGISTROS_DIR, exist_ok=True)
+    ruta_pstats = obtener_ruta_disponible(
+        os.path.join(REGISTROS_DIR, f"perfil_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pstats")
+    )
+    ruta_reporte = os.path.splitext(ruta_pstats)[0] + ".txt"
+
+    # Si tracemalloc ya estaba activo (PYTHONTRACEMALLOC) se respeta y no se detiene
+    memoria_propia = not tracemalloc.is_tracing()
+    if memoria_propia:
+        tracemalloc.start(10)
+    tracemalloc.reset_peak()
+    perfilador = cProfile.Profile()
+    perfilador.enable()
+    try:
+        resultado = funcion(*args, **kwargs)
+    finally:
+        perfilador.disable()
+        pico = tracemalloc.get_traced_memory()[1]
+        asignaciones = tracemalloc.take_snapshot().statistics("lineno")[:TOP_PERFIL]
+        if memoria_propia:
+            tracemalloc.stop()
+
+        perfilador.dump_stats(ruta_pstats)
+        texto = io.StringIO()
+        estadisticas = pstats.Stats(perfilador, stream=texto)
+        estadisticas.sort_stats("cumulative").print_stats(TOP_PERFIL)
+        estadisticas.sort_stats("tottime").print_stats(TOP_PERFIL)
+        with open(ruta_reporte, "w", encoding="utf-8") as f:
+            f.write(f"Pico de memoria (tracemalloc): {pico / 1048576:.1f} MB\n\n")
+            f.write(f"Top {TOP_PERFIL} lineas por memoria asignada al final:\n")
+            for estadistica in asignaciones:
+                f.write(f"  {estadistica}\n")
+            f.write("\n")
+            f.write(texto.getvalue())
+
+    # Funciones con mas tiempo propio, para el resumen en pantalla
+    mas_costosas = sorted(estadisticas.stats.items(), key=lambda x: -x[1][2])[:5]
+    perfil = {
+        "pstats": ruta_pstats,
+        "reporte": ruta_reporte,
+        "pico_memoria_mb": round(pico / 1048576, 1),
+        "funciones": [
+            {"funcion": f"{nombre} ({os.path.basename(archivo)}:{linea})", "segundos": round(tiempo[2], 3)}
+            for (archivo, linea, nombre), tiempo in mas_costosas
+        ],
+    }
+    return resultado, perfil
+
+
+def texto_perfil(perfil):
+    lineas = [f"Perfil: {os.path.basename(perfil['pstats'])} (pico de memoria {perfil['pico_memoria_mb']} MB)"]
+    lineas += [f"  {f['funcion']}: {f['segundos']:.2f} s" for f in perfil["funciones"][:3]]
+    return "\n".join(lineas)
+
+
+
+
 # ------------------------------
 # FUNCIONES DEL PROGRAMA
 # ------------------------------
-def crear_copia_seguridad(log_callback=None):
+def _mismo_archivo(ruta_a, ruta_b):
+    # Tamaño y fecha de modificacion en nanosegundos (copy2 la conserva): con segundos enteros
+    # una edicion en el mismo segundo que no cambia el tamaño se enlazaba a la copia vieja
+    if not os.path.isfile(ruta_b):
+        return False
+    return huella_archivo(ruta_a) == huella_archivo(ruta_b)
+
+
+def copiar_incremental(origen, destino, copia_anterior=None):
+    # Copia completa de la carpeta, pero los archivos sin cambios respecto a la copia
+    # anterior se enlazan (hardlink) en lugar de copiarse. Cada copia sigue siendo una
+    # carpeta completa que se restaura copiandola tal cual.
+    copiados = 0
+    enlazados = 0
+    with tramo("copiar_incremental", bytes_escritos=0) as datos:
+        for carpeta_actual, _, archivos in os.walk(origen):
+            relativa = os.path.relpath(carpeta_actual, origen)
+            os.makedirs(os.path.join(destino, relativa), exist_ok=True)
+            for archivo in archivos:
+                ruta = os.path.join(carpeta_actual, archivo)
+                ruta_destino = os.path.join(destino, relativa, archivo)
+                if copia_anterior:
+                    ruta_anterior = os.path.join(copia_anterior, relativa, archivo)
+                    if _mismo_archivo(ruta, ruta_anterior):
+                        try:
+                            os.link(ruta_anterior, ruta_destino)
+                            enlazados += 1
+                            continue
+                        except OSError:
+                            pass  # Sistema de archivos sin hardlinks: se copia
+                shutil.copy2(ruta, ruta_destino)
+                datos["bytes_escritos"] += os.path.getsize(ruta_destino)
+                copiados += 1
+    return copiados, enlazados
+
+
+def listar_copias_seguridad():
+    copias = [d for d in os.listdir(COPIAS_DIR)
+              if os.path.isdir(os.path.join(COPIAS_DIR, d)) and d.startswith("CONTROL_")]
+    copias.sort()  # Orden cronológico (por nombre)
+    return copias
+
+
+def crear_copia_seguridad(log_callback=None, incremental=COPIAS_INCREMENTALES):
     log_callback = log_callback or default_log
 
     if not os.path.exists(COPIAS_DIR):
         os.makedirs(COPIAS_DIR)
 
+    copias_previas = listar_copias_seguridad()
+
     # Nombre base de la carpeta de backup
     fecha = datetime.now().strftime("%Y%m%d_%H%M")
     nombre_base = f"CONTROL_{fecha}"
@@ -82,20 +369,35 @@ def crear_copia_seguridad(log_callback=None):
         nombre_backup = os.path.basename(ruta_backup)
 
 
-    # Copiar toda la carpeta CONTROL
+    # Copiar toda la carpeta CONTROL y, si existe, el libro mayor (en "<copia>/Libro mayor")
+    origenes = [("CONTROL", ruta_backup)]
+    if os.path.isdir(LIBRO_MAYOR_DIR):
+        origenes.append((LIBRO_MAYOR_DIR, os.path.join(ruta_backup, CARPETA_COPIA_LIBRO_MAYOR)))
     try:
-        shutil.copytree("CONTROL", ruta_backup)
-        log_callback(f"Copia de seguridad creada: {nombre_backup}\n")
+        if incremental:
+            copia_anterior = os.path.join(COPIAS_DIR, copias_previas[-1]) if copias_previas else None
+            copiados = enlazados = 0
+            for origen, destino in origenes:
+                anterior = copia_anterior and os.path.join(copia_anterior, os.path.relpath(destino, ruta_backup))
+                resultado = copiar_incremental(origen, destino, anterior)
+                copiados += resultado[0]
+                enlazados += resultado[1]
+            log_callback(f"Copia de seguridad creada: {nombre_backup} "
+                         f"({copiados} archivos copiados, {enlazados} sin cambios)\n")
+        else:
+            with tramo("copytree"):
+                for origen, destino in origenes:
+                    shutil.copytree(origen, destino, dirs_exist_ok=True)
+            log_callback(f"Copia de seguridad creada: {nombre_backup}\n")
     except Exception as e:
         log_callback(f"[ERROR] No se pudo crear la copia de seguridad: {e}")
-        return
+        return None
 
-    # Limitar a 15 copias 
-    copias = [d for d in os.listdir(COPIAS_DIR)
-              if os.path.isdir(os.path.join(COPIAS_DIR, d)) and d.startswith("CONTROL_")]
-    copias.sort()  # Orden cronológico (por nombre)
+    # Limitar la cantidad de copias (las incrementales ocupan solo lo que cambio)
+    copias = listar_copias_seguridad()
+    max_copias = MAX_COPIAS_INCREMENTALES if incremental else MAX_COPIAS
 
-    while len(copias) > 15:
+    while len(copias) > max_copias:
         copia_mas_antigua = copias.pop(0)
         ruta_a_eliminar = os.path.join(COPIAS_DIR, copia_mas_antigua)
         try:
@@ -104,6 +406,8 @@ def crear_copia_seguridad(log_callback=None):
         except Exception as e:
             log_callback(f"[ERROR] No se pudo eliminar la copia antigua {copia_mas_antigua}: {e}")
 
+    return nombre_backup
+
 
 
 
@@ -112,9 +416,71 @@ def default_log(msg):
 
 
 
-def ajustar_formato_archivo_pago(ruta_archivo, fecha_pago, log_callback=None):
+def _valor_excel(valor):
+    # Mismo valor que escribe pandas.to_excel: NaN vacio y tipos de numpy a tipos de Python
+    if valor is None or (not isinstance(valor, str) and pd.isna(valor)):
+        return None
+    if isinstance(valor, pd.Timestamp):
+        return valor.to_pydatetime()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+
+def _largo_celda(valor):
+    # Largo del valor tal como se lee al reabrir el Excel (1234.0 se guarda como 1234)
+    if valor is None or valor == "":
+        return 0
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return len(str(valor))
+
+
+def celda_con_estilo(ws, valor, estilo):
+    # WriteOnlyCell con el estilo puesto por la API publica de openpyxl.
+    # estilo: {atributo: valor}, por ejemplo {"alignment": ..., "number_format": ...}
+    cell = WriteOnlyCell(ws, value=valor)
+    for atributo, valor_estilo in estilo.items():
+        setattr(cell, atributo, valor_estilo)
+    return cell
+
+
+def escribir_excel_formateado(df, ruta, fuente_encabezado=None):
+    # Escribe el DataFrame con el formato final (centrado, ancho de columnas y fuente del
+    # encabezado) en una sola pasada, con openpyxl en modo write-only
+    encabezados = list(df.columns)
+    filas = [[_valor_excel(v) for v in fila] for fila in df.itertuples(index=False, name=None)]
+
+    anchos = [_largo_celda(h) for h in encabezados]
+    for fila in filas:
+        for idx, valor in enumerate(fila):
+            anchos[idx] = max(anchos[idx], _largo_celda(valor))
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    for idx, ancho in enumerate(anchos, start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = ancho + 8
+
+    # Estilos armados una vez; las fechas llevan ademas su formato
+    alineacion = Alignment(horizontal="center", vertical="center")
+    estilo = {"alignment": alineacion}
+    estilo_fecha = {"alignment": alineacion, "number_format": "DD/MM/YYYY"}
+    estilo_encabezado = {"alignment": alineacion}
+    if fuente_encabezado is not None:
+        estilo_encabezado["font"] = fuente_encabezado
+
+    def celda(valor, base):
+        return celda_con_estilo(ws, valor, estilo_fecha if isinstance(valor, datetime) else base)
+
+    ws.append([celda(h, estilo_encabezado) for h in encabezados])
+    for fila in filas:
+        ws.append([celda(v, estilo) for v in fila])
+    guardar_libro(wb, ruta)
+
+
+def ajustar_formato_archivo_pago(ruta_archivo, fecha_pago, log_callback=None, carpeta_destino=None):
     log_callback = log_callback or default_log
-    df = pd.read_excel(ruta_archivo, dtype=str)
+    df = leer_excel(ruta_archivo, dtype=str)
     df.columns = [col.strip().upper() for col in df.columns]
 
     if df.shape[1] >= 5:
@@ -143,153 +509,242 @@ def ajustar_formato_archivo_pago(ruta_archivo, fecha_pago, log_callback=None):
     df["FECHA PAGO"] = fecha_pago_str
 
     nombre_nuevo = f"pago_{fecha_pago_str.replace('/','-')}.xlsx"
-    carpeta = os.path.dirname(ruta_archivo)
+    # Con carpeta_destino el original queda en su lugar y se borra al pasar al historial
+    carpeta = carpeta_destino or os.path.dirname(ruta_archivo)
     nueva_ruta = os.path.join(carpeta, nombre_nuevo)
 
-    with pd.ExcelWriter(nueva_ruta, engine="openpyxl", date_format="DD/MM/YYYY", datetime_format="DD/MM/YYYY") as writer:
-        df.to_excel(writer, index=False)
+    # Archivo ya centrado y con ancho de columnas en una sola escritura
+    escribir_excel_formateado(df, nueva_ruta)
 
-    if nueva_ruta != ruta_archivo:
+    if carpeta_destino is None and nueva_ruta != ruta_archivo:
         os.remove(ruta_archivo)
 
-    # Ajustar formato de columnas en el Excel
-    wb = load_workbook(nueva_ruta)
-    ws = wb.active
-    for col in ws.columns:
-        max_length = 0
-        column_letter = col[0].column_letter
-        for cell in col:
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            if cell.value is not None:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[column_letter].width = max_length + 8
-    wb.save(nueva_ruta)
-
     return nueva_ruta
 
 
 
 
-def agregar_pago(nuevo_destino, log_callback=None, errores_detallados=None, log_completo=None):
-    log_callback = log_callback or default_log
-    errores_detallados = errores_detallados or []
-    log_completo = log_completo or []
-
-    def log_wrapper(mensaje):
-        log_callback(mensaje)
-        log_completo.append(mensaje)
-
-    # Fuerzo que las columnas FECHA y FECHA PAGO se lean como texto para evitar errores
-    df_pago = pd.read_excel(nuevo_destino, dtype={"FECHA": str, "FECHA PAGO": str})
-    df_pago.columns = [col.strip().upper() for col in df_pago.columns]
-
-    for col in ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"]:
-        if col not in df_pago.columns:
-            raise KeyError(f"El archivo de pago no tiene la columna {col}")
-
-    color_pagado = PatternFill(start_color="93c47d", end_color="93c47d", fill_type="solid")
-    color_diferencia = PatternFill(start_color="f6b26b", end_color="f6b26b", fill_type="solid")
+def _convertir_float(serie):
+    # Igual que float(valor) fila a fila: devuelve los valores y cuales se pudieron convertir
+    valores = pd.to_numeric(serie, errors="coerce").astype(float).to_numpy(copy=True)
+    validos = np.ones(len(serie), dtype=bool)
+    for i in np.flatnonzero(np.isnan(valores) & serie.notna().to_numpy()):
+        try:
+            valores[i] = float(serie.iloc[i])
+        except (ValueError, TypeError):
+            validos[i] = False
+    return valores, validos
+
+
+def parsear_fechas_pago(columna):
+    # Fechas de un archivo de pago: formato normalizado vectorizado, el resto fila a fila como
+    # antes (dayfirst). Las que no se pueden leer quedan NaT
+    fechas = pd.to_datetime(columna, format="%d/%m/%Y", errors="coerce")
+    for i in np.flatnonzero(fechas.isna().to_numpy() & columna.notna().to_numpy()):
+        fechas.iloc[i] = pd.to_datetime(columna.iloc[i], dayfirst=True, errors="coerce")
+    return fechas
+
+
+def conciliar_pagos(df_pago, nuevo_destino, libro=None):
+    # Cruza todo el archivo de pago contra los CONTROL por (año, hoja, NUMERO) y decide el estado
+    # de todas las filas a la vez. Devuelve los eventos (log, error y cambio) en el orden del archivo.
+    # Con libro (LibroMayor) se busca en las particiones y "fila" es la posicion dentro de la particion
+    n = len(df_pago)
+
+    fechas = parsear_fechas_pago(df_pago["FECHA"])
+    fechas_validas = fechas.notna().to_numpy()
+
+    pagos = pd.DataFrame({
+        "POS": np.arange(n),
+        "ANIO": fechas.dt.year,
+        "HOJA": fechas.dt.month.map(MESES_ES),
+        "CLAVE": df_pago["NUMERO"].astype(str).to_numpy(),
+    })[fechas_validas]
+    pagos["ANIO"] = pagos["ANIO"].astype(int)
+
+    # Cargar las hojas necesarias de cada CONTROL como DataFrame (desde el indice de numeros)
+    rutas = {}
+    anios_existentes = set()
+    hojas_existentes = set()
+    filas_control = []
+    for anio, hojas in pagos.groupby("ANIO")["HOJA"].unique().items():
+        ruta = obtener_ruta_control_por_anio(anio)
+        rutas[anio] = ruta
+        if libro is not None:
+            if not libro.hojas(anio):
+                continue
+            filas_por_hoja = {hoja: libro.posiciones(anio, hoja) for hoja in hojas if libro.existe(anio, hoja)}
+        else:
+            if not os.path.exists(ruta):
+                continue
+            indice = obtener_indice_numeros(ruta, anio)
+            filas_por_hoja = {hoja: indice.hojas[hoja] for hoja in hojas if hoja in indice.hojas}
+        anios_existentes.add(anio)
+        for hoja, filas in filas_por_hoja.items():
+            hojas_existentes.add((anio, hoja))
+            filas_control.extend((anio, hoja, clave, fila) for clave, fila in filas.items())
+
+    control = pd.DataFrame(filas_control, columns=["ANIO", "HOJA", "CLAVE", "FILA"])
+    control["ANIO"] = control["ANIO"].astype(int)
+    cruce = pagos.merge(control, on=["ANIO", "HOJA", "CLAVE"], how="left")
+    filas_encontradas = np.full(n, -1)
+    filas_encontradas[cruce["POS"].to_numpy()] = cruce["FILA"].fillna(-1).astype(int).to_numpy()
+
+    # Estado de todas las filas con NumPy
+    monto_base, base_valido = _convertir_float(df_pago["MONTO"])
+    monto_pagado, pagado_valido = _convertir_float(df_pago["PAGADO"])
+    diferencia = np.abs(monto_base - monto_pagado)
+    with np.errstate(invalid="ignore"):
+        porcentaje_diferencia = np.divide(diferencia, np.abs(monto_base), out=np.zeros(n), where=monto_base != 0)
+        pagado = (
+            (monto_base == monto_pagado) |
+            (np.abs(porcentaje_diferencia - 0.22) < 0.01) |
+            (np.abs(porcentaje_diferencia - 0.10) < 0.01)
+        )
 
-    log_wrapper(f"\n{'-'*60}\nProcesando archivo de pago: {nuevo_destino}\n{'-'*60}\n")
+    eventos = []
+    numeros = df_pago["NUMERO"].tolist()
+    montos = df_pago["MONTO"].tolist()
+    pagados = df_pago["PAGADO"].tolist()
+    fechas_pago = df_pago["FECHA PAGO"].tolist()
 
-    for _, fila in df_pago.iterrows():
-        # Convierto a datetime usando dayfirst=True para asegurar dd/mm/yyyy
-        fecha = pd.to_datetime(fila["FECHA"], dayfirst=True, errors="coerce")
-        if pd.isna(fecha):
-            log_wrapper(f"[ERROR] Fecha inválida en fila: {fila}")
+    for i in range(n):
+        if not fechas_validas[i]:
+            eventos.append({"mensaje": f"[ERROR] Fecha inválida en fila: {df_pago.iloc[i]}"})
             continue
 
+        fecha = fechas.iloc[i]
+        fecha_str = fecha.strftime("%d/%m/%Y")
         anio = fecha.year
-        mes_nombre = MESES_ES.get(fecha.month, None)
-        if not mes_nombre:
-            log_wrapper(f"[ERROR] Mes inválido para fecha {fecha}")
-            continue
-
-        numero = fila["NUMERO"]
-        monto_base = fila["MONTO"]
-        monto_pagado = fila["PAGADO"]
-        fecha_pago_val = fila["FECHA PAGO"]
+        mes_nombre = MESES_ES[fecha.month]
+        numero = numeros[i]
 
-        archivo_control = obtener_ruta_control_por_anio(anio)
-
-        if not os.path.exists(archivo_control):
+        descripcion = None
+        if anio not in anios_existentes:
             descripcion = f"Archivo CONTROL para año {anio} no encontrado"
-            errores_detallados.append({
-                "archivo": nuevo_destino,
-                "tipo": "Pago",
-                "numero": numero,
-                "fecha": fecha.strftime("%d/%m/%Y"),
-                "descripcion": descripcion
+        elif (anio, mes_nombre) not in hojas_existentes:
+            descripcion = f"Hoja {mes_nombre} no existe en archivo CONTROL {anio}"
+        elif filas_encontradas[i] < 0:
+            descripcion = f"Número {numero} con monto {montos[i]} no encontrado en hoja {mes_nombre} del CONTROL {anio}"
+
+        if descripcion:
+            eventos.append({
+                "mensaje": f"[ERROR] {descripcion}",
+                "error": {
+                    "archivo": nuevo_destino,
+                    "tipo": "Pago",
+                    "numero": numero,
+                    "fecha": fecha_str,
+                    "descripcion": descripcion
+                }
             })
-            log_wrapper(f"[ERROR] {descripcion}")
             continue
 
-        wb = load_workbook(archivo_control)
-
-        if mes_nombre not in wb.sheetnames:
-            descripcion = f"Hoja {mes_nombre} no existe en archivo CONTROL {anio}"
-            errores_detallados.append({
-                "archivo": nuevo_destino,
-                "tipo": "Pago",
-                "numero": numero,
-                "fecha": fecha.strftime("%d/%m/%Y"),
-                "descripcion": descripcion
-            })
-            log_wrapper(f"[ERROR] {descripcion}")
+        if not (base_valido[i] and pagado_valido[i]):
+            eventos.append({"mensaje": f"[ERROR] Monto inválido en fila: {df_pago.iloc[i]}"})
             continue
 
-        ws = wb[mes_nombre]
-        encontrado = False
+        eventos.append({
+            "mensaje": f"Fila actualizada en CONTROL {anio}: Número {numero}, Fecha {fecha_str}",
+            "cambio": {
+                "archivo": rutas[anio],
+                "anio": anio,
+                "hoja": mes_nombre,
+                "fila": int(filas_encontradas[i]),
+                "estado": "PAGADO" if pagado[i] else "DIFERENCIA",
+                "pagado": pagados[i],
+                "fecha_pago": fechas_pago[i],
+            }
+        })
 
-        for row in ws.iter_rows(min_row=2):
-            cell_numero = row[1].value
-            if str(cell_numero) == str(numero):
-                encontrado = True
-                try:
-                    monto_base_float = float(monto_base)
-                    monto_pagado_float = float(monto_pagado)
-                except (ValueError, TypeError):
-                    log_wrapper(f"[ERROR] Monto inválido en fila: {fila}")
-                    continue
+    return eventos
 
-                diferencia = abs(monto_base_float - monto_pagado_float)
-                porcentaje_diferencia = diferencia / abs(monto_base_float) if monto_base_float != 0 else 0
 
-                if (
-                    monto_base_float == monto_pagado_float or
-                    abs(porcentaje_diferencia - 0.22) < 0.01 or
-                    abs(porcentaje_diferencia - 0.10) < 0.01
-                ):
-                    fill_color = color_pagado
-                else:
-                    fill_color = color_diferencia
 
 
-                for cell in row:
-                    cell.fill = fill_color
-                row[3].value = monto_pagado
-                row[4].value = fecha_pago_val
-                log_wrapper(f"Fila actualizada en CONTROL {anio}: Número {numero}, Fecha {fecha.strftime('%d/%m/%Y')}")
-                break
+def relleno_estado(estado):
+    color = COLORES_ESTADO[estado]
+    return PatternFill(start_color=color, end_color=color, fill_type="solid")
 
-        if not encontrado:
-            descripcion = f"Número {numero} con monto {monto_base} no encontrado en hoja {mes_nombre} del CONTROL {anio}"
-            errores_detallados.append({
-                "archivo": nuevo_destino,
-                "tipo": "Pago",
-                "numero": numero,
-                "fecha": fecha.strftime("%d/%m/%Y"),
-                "descripcion": descripcion
-            })
-            log_wrapper(f"[ERROR] {descripcion}")
 
-        wb.save(archivo_control)
+def columna_estado(ws):
+    # Numero de columna de ESTADO en la hoja (A = 1). Las hojas anteriores a la columna la
+    # reciben al final del encabezado; sus filas viejas se siguen leyendo por color
+    encabezados = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+    normalizados = [v.strip().upper() if isinstance(v, str) else "" for v in encabezados]
+    if "ESTADO" in normalizados:
+        return normalizados.index("ESTADO") + 1
+    columna = max((i for i, v in enumerate(normalizados, start=1) if v), default=0) + 1
+    cell = ws.cell(row=1, column=columna, value="ESTADO")
+    cell.alignment = Alignment(horizontal="center", vertical="center")
+    return columna
+
 
+def agregar_pago(nuevo_destino, log_callback=None, errores_detallados=None, log_completo=None):
+    log_callback = log_callback or default_log
+    # Con "is None" las listas vacias que pasa main() se llenan en lugar de reemplazarse
+    errores_detallados = errores_detallados if errores_detallados is not None else []
+    log_completo = log_completo if log_completo is not None else []
+
+    def log_wrapper(mensaje):
+        log_callback(mensaje)
+        log_completo.append(mensaje)
 
+    # Fuerzo que las columnas FECHA y FECHA PAGO se lean como texto para evitar errores
+    df_pago = leer_excel(nuevo_destino, dtype={"FECHA": str, "FECHA PAGO": str})
+    df_pago.columns = [col.strip().upper() for col in df_pago.columns]
 
+    for col in ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"]:
+        if col not in df_pago.columns:
+            raise KeyError(f"El archivo de pago no tiene la columna {col}")
 
-def ajustar_formato_archivo_control(ruta_archivo):
-    df = pd.read_excel(ruta_archivo)
+    colores = {estado: relleno_estado(estado) for estado in ("PAGADO", "DIFERENCIA")}
+
+    log_wrapper(f"\n{'-'*60}\nProcesando archivo de pago: {nuevo_destino}\n{'-'*60}\n")
+
+    # Con el libro mayor activo los pagos se aplican a las particiones y el CONTROL se regenera
+    if MODO_ALMACENAMIENTO == "parquet":
+        return agregar_pago_libro_mayor(df_pago, nuevo_destino, log_wrapper, errores_detallados)
+
+    # Cada CONTROL se abre una sola vez por archivo de pago y se guarda al final
+    # Como siempre, el pago no toca anchos ni alineacion: solo valores y color de la fila
+    libros = {}
+    columnas_estado = {}
+
+    facturas_actualizadas = 0
+    for evento in conciliar_pagos(df_pago, nuevo_destino):
+        cambio = evento.get("cambio")
+        if cambio:
+            facturas_actualizadas += 1
+            archivo_control = cambio["archivo"]
+            if archivo_control not in libros:
+                libros[archivo_control] = cargar_libro_control(archivo_control)
+            ws = libros[archivo_control][cambio["hoja"]]
+            if (archivo_control, ws.title) not in columnas_estado:
+                columnas_estado[(archivo_control, ws.title)] = columna_estado(ws)
+            celda_estado = ws.cell(row=cambio["fila"], column=columnas_estado[(archivo_control, ws.title)])
+            celda_estado.value = cambio["estado"]
+            row = ws[cambio["fila"]]
+            for cell in row:
+                cell.fill = colores[cambio["estado"]]
+            row[3].value = cambio["pagado"]
+            row[4].value = cambio["fecha_pago"]
+        if evento.get("error"):
+            errores_detallados.append(evento["error"])
+        log_wrapper(evento["mensaje"])
+
+    # Un solo guardado por cada CONTROL tocado
+    for archivo_control, wb in libros.items():
+        guardar_libro_control(archivo_control, wb)
+        confirmar_guardado_indice(archivo_control)
+
+    return {"facturas_actualizadas": facturas_actualizadas}
+
+
+
+
+def ajustar_formato_archivo_control(ruta_archivo, carpeta_destino=None):
+    df = leer_excel(ruta_archivo)
 
     # Elimina columnas
     columnas_a_eliminar = ["Cliente", "Tipodocum", "Documento", "Serie", "Nrdoc", "Cfe_serie", "Nrodoc"]
@@ -324,114 +779,196 @@ def ajustar_formato_archivo_control(ruta_archivo):
     else:
         nuevo_nombre = os.path.basename(ruta_archivo)
 
-    carpeta = os.path.dirname(ruta_archivo)
+    # Con carpeta_destino el original queda en su lugar y se borra al pasar al historial
+    carpeta = carpeta_destino or os.path.dirname(ruta_archivo)
     nueva_ruta = os.path.join(carpeta, nuevo_nombre)
 
-    with pd.ExcelWriter(nueva_ruta, engine="openpyxl", date_format="DD/MM/YYYY", datetime_format="DD/MM/YYYY") as writer:
-        df.to_excel(writer, index=False)
-
-    wb = load_workbook(nueva_ruta)
-    ws = wb.active
-    for cell in ws[1]:
-        cell.font = Font(bold=False)
-    wb.save(nueva_ruta)
+    # Encabezado sin negrita, centrado y ancho de columnas en una sola escritura
+    escribir_excel_formateado(df, nueva_ruta, fuente_encabezado=Font(bold=False))
 
-    if nueva_ruta != ruta_archivo:
+    if carpeta_destino is None and nueva_ruta != ruta_archivo:
         os.remove(ruta_archivo)
 
-    wb = load_workbook(nueva_ruta)
-    ws = wb.active
-    for col in ws.columns:
-        max_length = 0
-        column_letter = col[0].column_letter
-        for cell in col:
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-            if cell.value is not None:
-                max_length = max(max_length, len(str(cell.value)))
-        ws.column_dimensions[column_letter].width = max_length + 8
-    wb.save(nueva_ruta)
-
-    return nueva_ruta
+    # Se devuelve tambien el DataFrame para no volver a leer el archivo
+    return nueva_ruta, df
 
-def agregar_control(archivo_control, archivo_agregar, log_callback=None, errores_detallados=None, log_completo=None):
-    log_callback = log_callback or default_log
-    errores_detallados = errores_detallados or []
-    log_completo = log_completo or []
-
-    def log_wrapper(mensaje):
-        log_callback(mensaje)
-        log_completo.append(mensaje)
-
-    df_agregar = pd.read_excel(archivo_agregar)
-    wb = load_workbook(archivo_control)
+def separar_filas_nuevas(df_agregar, numeros_hoja, archivo_agregar, log_wrapper, errores_detallados):
+    # Separa las filas a agregar de las duplicadas (ya en la hoja o repetidas en el archivo).
+    # numeros_hoja(hoja) devuelve los NUMERO (texto) que ya tiene cada hoja del CONTROL.
+    # Devuelve ({hoja: [filas nuevas]}, filas agregadas, filas omitidas)
     filas_agregadas = 0
     filas_omitidas = 0
 
-    for idx, fila in df_agregar.iterrows():
-        fecha = pd.to_datetime(fila["FECHA"], dayfirst=True)
-        locale.setlocale(locale.LC_TIME, "es_ES.UTF-8")
-        mes_nombre = calendar.month_name[fecha.month].upper()
-
-        if mes_nombre not in wb.sheetnames:
-            ws = wb.create_sheet(title=mes_nombre)
-            ws.append(["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"])
-        else:
-            ws = wb[mes_nombre]
-
-        numeros_existentes = [str(cell.value) for cell in ws["B"][1:]]
-        if str(fila["NUMERO"]) in numeros_existentes:
+    # Hoja destino y numero de todas las filas de una vez
+    fechas = pd.to_datetime(df_agregar["FECHA"], dayfirst=True)
+    meses = fechas.dt.month.map(MESES_ES)
+    numeros = [_valor_excel(v) for v in df_agregar["NUMERO"]]
+    montos = [_valor_excel(v) for v in df_agregar["MONTO"]]
+
+    # Anti-join contra los numeros que ya estan en cada hoja, mas los repetidos dentro del mismo archivo
+    entrada = pd.DataFrame({"HOJA": meses.to_numpy(), "CLAVE": df_agregar["NUMERO"].astype(str).to_numpy()})
+    existentes = pd.DataFrame(
+        [(hoja, numero) for hoja in entrada["HOJA"].unique() for numero in numeros_hoja(hoja)],
+        columns=["HOJA", "CLAVE"]
+    ).drop_duplicates()
+    cruce = entrada.merge(existentes, on=["HOJA", "CLAVE"], how="left", indicator=True)
+    duplicados = (cruce["_merge"] == "both").to_numpy() | entrada.duplicated().to_numpy()
+
+    # Se recorre en el orden original solo para armar el log y los lotes por hoja
+    nuevas_por_hoja = {}
+    for fecha, mes_nombre, numero, monto, duplicado in zip(fechas, meses, numeros, montos, duplicados):
+        nuevas_por_hoja.setdefault(mes_nombre, [])
+
+        if duplicado:
             filas_omitidas += 1
             errores_detallados.append({
                 "archivo": archivo_agregar,
                 "tipo": "Control",
-                "numero": fila["NUMERO"],
+                "numero": numero,
                 "fecha": fecha.strftime("%d/%m/%Y"),
                 "descripcion": "Número duplicado, fila omitida"
             })
-            log_wrapper(f"[ERROR] Archivo: {archivo_agregar}, Número duplicado: {fila['NUMERO']}, Fecha: {fecha.strftime('%d/%m/%Y')}")
+            log_wrapper(f"[ERROR] Archivo: {archivo_agregar}, Número duplicado: {numero}, Fecha: {fecha.strftime('%d/%m/%Y')}")
             continue
 
-        nueva_fila = [
+        nuevas_por_hoja[mes_nombre].append([
             fecha.strftime("%d/%m/%Y"),
-            fila["NUMERO"],
-            fila["MONTO"],
+            numero,
+            monto,
             0,
             "-"
-        ]
-        ws.append(nueva_fila)
+        ])
         filas_agregadas += 1
-        log_wrapper(f"Fila agregada: Número {fila['NUMERO']}, Fecha {fecha.strftime('%d/%m/%Y')}")
-
-        fill = PatternFill(start_color="FF4040", end_color="FF4040", fill_type="solid")
-        for cell in ws[ws.max_row]:
-            cell.fill = fill
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-
-    for ws_iter in wb.worksheets:
-        for col in ws_iter.columns:
-            max_length = 0
-            col_letter = col[0].column_letter
-            for cell in col:
-                if cell.value is not None:
-                    max_length = max(max_length, len(str(cell.value)))
-                cell.alignment = Alignment(horizontal="center", vertical="center")
-            ws_iter.column_dimensions[col_letter].width = max_length + 8
-        for cell in ws_iter[1]:
-            cell.alignment = Alignment(horizontal="center", vertical="center")
+        log_wrapper(f"Fila agregada: Número {numero}, Fecha {fecha.strftime('%d/%m/%Y')}")
+
+    return nuevas_por_hoja, filas_agregadas, filas_omitidas
+
+
+def agregar_control(archivo_control, datos_agregar, log_callback=None, errores_detallados=None, log_completo=None, origen=None):
+    log_callback = log_callback or default_log
+    # Con "is None" las listas vacias que pasa main() se llenan en lugar de reemplazarse
+    errores_detallados = errores_detallados if errores_detallados is not None else []
+    log_completo = log_completo if log_completo is not None else []
+
+    def log_wrapper(mensaje):
+        log_callback(mensaje)
+        log_completo.append(mensaje)
+
+    # Acepta ruta a un Excel, DataFrame o filas (FECHA, NUMERO, MONTO) ya en memoria
+    if isinstance(datos_agregar, (str, os.PathLike)):
+        df_agregar = leer_excel(datos_agregar)
+        archivo_agregar = origen or datos_agregar
+    else:
+        if isinstance(datos_agregar, pd.DataFrame):
+            df_agregar = datos_agregar
+        else:
+            df_agregar = pd.DataFrame.from_records(list(datos_agregar), columns=["FECHA", "NUMERO", "MONTO"])
+        archivo_agregar = origen or "datos en memoria"
+
+    # Con el libro mayor activo las filas van a las particiones y el CONTROL se regenera
+    if MODO_ALMACENAMIENTO == "parquet":
+        return agregar_control_libro_mayor(archivo_control, df_agregar, archivo_agregar, log_wrapper, errores_detallados)
+
+    indice = obtener_indice_numeros(archivo_control)
+    wb = cargar_libro_control(archivo_control)
+    nuevas_por_hoja, filas_agregadas, filas_omitidas = separar_filas_nuevas(
+        df_agregar, indice.numeros, archivo_agregar, log_wrapper, errores_detallados
+    )
+
+    # Alta de todas las filas nuevas de cada hoja en un solo lote, con ESTADO "NO PAGADO"
+    fill = relleno_estado("NO PAGADO")
+    autoajuste = AutoAjusteColumnas()
+    for mes_nombre, nuevas_filas in nuevas_por_hoja.items():
+        if mes_nombre not in wb.sheetnames:
+            ws = wb.create_sheet(title=mes_nombre)
+            ws.append(ENCABEZADOS_CONTROL)
+            autoajuste.actualizar(ws, [ws.cell(row=1, column=col) for col in range(1, len(ENCABEZADOS_CONTROL) + 1)])
+        else:
+            ws = wb[mes_nombre]
+        col_estado = columna_estado(ws)
+        autoajuste.actualizar(ws, [ws.cell(row=1, column=col_estado)])
+
+        # Las filas se escriben en posiciones explicitas a partir del final de la hoja
+        fila = ws.max_row
+        for nueva_fila in nuevas_filas:
+            nueva_fila = nueva_fila + [None] * (col_estado - 1 - len(nueva_fila)) + ["NO PAGADO"]
+            fila += 1
+            celdas = [ws.cell(row=fila, column=col, value=valor) for col, valor in enumerate(nueva_fila, start=1)]
+            indice.registrar(mes_nombre, nueva_fila[1], fila)
+            for cell in celdas:
+                cell.fill = fill
+            autoajuste.actualizar(ws, celdas)
+
+    # Solo cambian los anchos de las columnas que recibieron valores mas largos
+    autoajuste.aplicar(wb)
 
     # Elimina la hoja temporal
     if "TEMP" in wb.sheetnames and len(wb.sheetnames) > 1:
         std = wb["TEMP"]
         wb.remove(std)
 
-    wb.save(archivo_control)
+    guardar_libro_control(archivo_control, wb)
+    indice.confirmar_guardado()
     log_wrapper(f"Archivo CONTROL actualizado: {filas_agregadas} filas agregadas, {filas_omitidas} filas omitidas.")
+    return {"filas_agregadas": filas_agregadas, "filas_omitidas": filas_omitidas}
 
 
 
-def chequeo_inicio():
+# Hilos para probar la apertura de archivos (en una carpeta de red pesa la latencia, no la CPU)
+MAX_HILOS_CHEQUEO = 8
+
+
+def _listar_xlsx(carpeta):
+    # Una sola lectura del directorio: (xlsx, xlsx con archivo "~$" de Excel al lado)
+    try:
+        nombres = {entrada.name for entrada in os.scandir(carpeta) if entrada.is_file()}
+    except FileNotFoundError:
+        return [], []
+    xlsx = sorted(n for n in nombres if n.lower().endswith(".xlsx") and not n.startswith("~"))
+    con_dueno = [n for n in xlsx if "~$" + n in nombres or "~$" + n[2:] in nombres]
+    return [os.path.join(carpeta, n) for n in xlsx], [os.path.join(carpeta, n) for n in con_dueno]
+
+
+def _anios_entrada(ruta, columna):
+    # Años de la columna de fechas de un archivo de entrada; None si no se pudo leer
+    try:
+        wb = load_workbook(ruta, read_only=True)
+        try:
+            filas = wb.worksheets[0].iter_rows(values_only=True)
+            encabezados = [str(v).strip().upper() if v is not None else "" for v in next(filas, ())]
+            if columna not in encabezados:
+                return set()
+            idx = encabezados.index(columna)
+            valores = [fila[idx] for fila in filas if idx < len(fila) and fila[idx] is not None]
+        finally:
+            wb.close()
+    except Exception:
+        return None
+
+    anios = {v.year for v in valores if isinstance(v, datetime)}
+    textos = [str(v) for v in valores if not isinstance(v, datetime)]
+    if textos:
+        fechas = pd.to_datetime(pd.Series(textos), dayfirst=True, errors="coerce", format="mixed")
+        anios.update(int(a) for a in fechas.dt.year.dropna())
+    return anios
+
+
+def _archivo_en_uso(ruta):
+    try:
+        with open(ruta, "a"):
+            pass
+        return False
+    except (PermissionError, OSError):
+        return True
+
+
+def verificar_inicio(tiempos=None):
+    # Chequeos previos sin ventanas: devuelve (archivos_incorrectos, archivos_abiertos).
+    # Los "~$" de Excel se buscan en todas las carpetas, pero solo se prueba abrir lo que
+    # esta corrida va a escribir: las entradas, los CONTROL de sus años y FacturasNoPagadas
+    tiempos = tiempos if tiempos is not None else {}
+    inicio = time.perf_counter()
     carpetas_verificar_formato = [AGREGAR_PAGO_DIR, AGREGAR_CONTROL_DIR, FACTURASNOPAGADAS_DIR]
-    carpetas_verificar_bloqueo = [AGREGAR_PAGO_DIR, AGREGAR_CONTROL_DIR, "CONTROL", FACTURASNOPAGADAS_DIR]
 
     archivos_incorrectos = []
     archivos_abiertos = []
@@ -443,35 +980,63 @@ def chequeo_inicio():
             if os.path.isfile(ruta_archivo):
                 if not archivo.lower().endswith(".xlsx"):
                     archivos_incorrectos.append(ruta_archivo)
+    tiempos["formato"] = round(time.perf_counter() - inicio, 3)
 
     if archivos_incorrectos:
-        mostrar_error_formato(archivos_incorrectos)
-        return  # Detener si hay error de formato
+        tiempos["total"] = tiempos["formato"]
+        return archivos_incorrectos, []  # Detener si hay error de formato
+
+    # Archivos abiertos en Excel, por su "~$" (sin abrir ningun xlsx)
+    inicio_etapa = time.perf_counter()
+    entradas_control, abiertos_control = _listar_xlsx(AGREGAR_CONTROL_DIR)
+    entradas_pago, abiertos_pago = _listar_xlsx(AGREGAR_PAGO_DIR)
+    _, abiertos_reporte = _listar_xlsx(FACTURASNOPAGADAS_DIR)
+    archivos_abiertos.extend(abiertos_control + abiertos_pago + abiertos_reporte)
+    controles = {}
+    if os.path.isdir(CONTROL_DIR):
+        for carpeta_anio in sorted(os.scandir(CONTROL_DIR), key=lambda e: e.name):
+            if carpeta_anio.is_dir():
+                controles[carpeta_anio.name] = os.path.join(CONTROL_DIR, carpeta_anio.name, f"CONTROL_{carpeta_anio.name}.xlsx")
+                archivos_abiertos.extend(_listar_xlsx(carpeta_anio.path)[1])
+    tiempos["archivos_excel"] = round(time.perf_counter() - inicio_etapa, 3)
+
+    with ThreadPoolExecutor(max_workers=MAX_HILOS_CHEQUEO) as pool:
+        # Años que tocan las entradas pendientes; si una no se puede leer se prueban todos los CONTROL
+        inicio_etapa = time.perf_counter()
+        anios_por_entrada = list(pool.map(_anios_entrada,
+                                          entradas_control + entradas_pago,
+                                          ["FECHA"] * (len(entradas_control) + len(entradas_pago))))
+        if any(anios is None for anios in anios_por_entrada):
+            necesarios = list(controles.values())
+        else:
+            anios = set().union(*anios_por_entrada)
+            necesarios = [ruta for anio, ruta in controles.items() if anio in {str(a) for a in anios}]
+        tiempos["anios_entradas"] = round(time.perf_counter() - inicio_etapa, 3)
+
+        # Prueba de apertura solo de los archivos que se van a escribir
+        inicio_etapa = time.perf_counter()
+        candidatos = entradas_control + entradas_pago + [ruta for ruta in necesarios if os.path.exists(ruta)]
+        ruta_facturas = os.path.join(FACTURASNOPAGADAS_DIR, "FacturasNoPagadas.xlsx")
+        if os.path.exists(ruta_facturas):
+            candidatos.append(ruta_facturas)
+        candidatos = [ruta for ruta in candidatos if ruta not in archivos_abiertos]
+        for ruta, en_uso in zip(candidatos, pool.map(_archivo_en_uso, candidatos)):
+            if en_uso:
+                archivos_abiertos.append(ruta)
+        tiempos["prueba_apertura"] = round(time.perf_counter() - inicio_etapa, 3)
+        tiempos["archivos_probados"] = len(candidatos)
+
+    tiempos["total"] = round(time.perf_counter() - inicio, 3)
+    return [], archivos_abiertos
 
-    # Verificar archivos abiertos
-    for carpeta in carpetas_verificar_bloqueo:
-        for carpeta_actual, _, archivos in os.walk(carpeta):
-            for archivo in archivos:
-                ruta = os.path.join(carpeta_actual, archivo)
 
-                # Ignorar archivos temporales como "~$archivo.xlsx" y no xlsx
-                if archivo.startswith("~") or not archivo.lower().endswith(".xlsx"):
-                    continue
+def chequeo_inicio():
+    # El desglose de tiempos queda para la CLI (tiempos.chequeo_inicio_detalle)
+    archivos_incorrectos, archivos_abiertos = verificar_inicio()
 
-                try:
-                    with open(ruta, "a"):
-                        pass  
-                except (PermissionError, OSError):
-                    archivos_abiertos.append(ruta)
-
-    # Chequear especificamente FacturasNoPagadas.xlsx
-    ruta_facturas = os.path.join(FACTURASNOPAGADAS_DIR, "FacturasNoPagadas.xlsx")
-    if os.path.exists(ruta_facturas):
-        try:
-            with open(ruta_facturas, "a"):
-                pass
-        except (PermissionError, OSError):
-            archivos_abiertos.append(ruta_facturas)
+    if archivos_incorrectos:
+        mostrar_error_formato(archivos_incorrectos)
+        return  # Detener si hay error de formato
 
     if archivos_abiertos:
         mostrar_error_archivo_abierto(archivos_abiertos)
@@ -509,92 +1074,1094 @@ def abrir_control_mas_reciente():
 
 
 
+#----------------------------
+# AUTOAJUSTE DE COLUMNAS
+#----------------------------
+# Espacio extra que se suma al largo del valor mas largo de cada columna
+MARGEN_ANCHO_COLUMNA = 8
+
+
+class AutoAjusteColumnas:
+    # Guarda el largo maximo por hoja y columna y lo actualiza solo con las celdas nuevas o
+    # modificadas, en vez de recorrer todo el libro en cada guardado
+    def __init__(self, margen=MARGEN_ANCHO_COLUMNA):
+        self.margen = margen
+        self.largos = {}  # {hoja: {columna: largo}}
+        self.pendientes = {}  # {hoja: {columnas a escribir}}
+
+    def _largo_guardado(self, ws, columna):
+        # El ancho guardado por una ejecucion anterior ya es el largo maximo mas el margen
+        for dim in ws.column_dimensions.values():
+            if dim.customWidth and dim.width and dim.min and dim.max and dim.min <= columna <= dim.max:
+                return max(dim.width - self.margen, 0)
+        return None
+
+    def _medir_columna(self, ws, columna):
+        # Columna sin ancho propio: se recorre una sola vez
+        largo = 0
+        for (valor,) in ws.iter_rows(min_col=columna, max_col=columna, values_only=True):
+            if valor is not None:
+                largo = max(largo, len(str(valor)))
+        return largo
+
+    def actualizar(self, ws, celdas):
+        # Centra las celdas y ajusta el largo de sus columnas
+        largos = self.largos.setdefault(ws.title, {})
+        pendientes = self.pendientes.setdefault(ws.title, set())
+        alineacion = Alignment(horizontal="center", vertical="center")
+        for cell in celdas:
+            cell.alignment = alineacion
+            columna = cell.column
+            if columna not in largos:
+                largos[columna] = self._largo_guardado(ws, columna)
+                if largos[columna] is None:
+                    # Sin ancho guardado: se mide una vez y se escribe al aplicar
+                    largos[columna] = self._medir_columna(ws, columna)
+                    pendientes.add(columna)
+            if cell.value is not None:
+                largo = len(str(cell.value))
+                if largo > largos[columna]:
+                    largos[columna] = largo
+                    pendientes.add(columna)
+
+    def aplicar(self, wb):
+        # Escribe solo los anchos que cambiaron
+        for hoja, columnas in self.pendientes.items():
+            if hoja not in wb.sheetnames:
+                continue
+            ws = wb[hoja]
+            for columna in columnas:
+                ws.column_dimensions[get_column_letter(columna)].width = self.largos[hoja][columna] + self.margen
+        self.pendientes = {}
+
+
+#----------------------------
+# INDICE DE NUMEROS (CONTROL)
+#----------------------------
+# Cache de indices por ruta de CONTROL, se reutiliza mientras el archivo no cambie
+_INDICES_NUMEROS = {}
+
+
+def huella_archivo(ruta):
+    estado = os.stat(ruta)
+    return (estado.st_mtime_ns, estado.st_size)
+
+
+class IndiceNumeros:
+    # Mapea NUMERO -> (anio, hoja, fila) para un CONTROL_<anio>.xlsx
+
+    def __init__(self, ruta, anio):
+        self.ruta = ruta
+        self.anio = anio
+        self.hojas = {}  # hoja -> {numero: fila}
+        self.huella = None
+
+    def construir(self):
+        # Si el indice SQLite esta al dia se usa directamente, sin abrir el xlsx
+        self.hojas = {}
+        if self._construir_desde_sqlite():
+            return self
+
+        # Una sola pasada en modo lectura, solo valores
+        with tramo("indice_numeros", archivo=os.path.basename(self.ruta),
+                   bytes_leidos=os.path.getsize(self.ruta)) as datos:
+            wb = load_workbook(self.ruta, read_only=True)
+            try:
+                for ws in wb.worksheets:
+                    filas = {}
+                    for fila_num, row in enumerate(ws.iter_rows(min_row=2, values_only=True), start=2):
+                        valor = row[1] if len(row) > 1 else None
+                        # Igual que la busqueda lineal: gana la primera aparicion
+                        filas.setdefault(str(valor), fila_num)
+                    self.hojas[ws.title] = filas
+            finally:
+                wb.close()
+            datos["filas"] = sum(len(filas) for filas in self.hojas.values())
+        self.huella = huella_archivo(self.ruta)
+        return self
+
+    def _construir_desde_sqlite(self):
+        if not os.path.exists(INDICE_DB):
+            return False
+        huella = huella_archivo(self.ruta)
+        conn = conectar_indice()
+        try:
+            clave = clave_archivo_indice(self.ruta)
+            registro = conn.execute(
+                "SELECT mtime_ns, tamano FROM archivos WHERE ruta = ?", (clave,)
+            ).fetchone()
+            if registro is None or tuple(registro) != huella:
+                return False
+            for hoja, in conn.execute("SELECT hoja FROM hojas WHERE ruta = ? ORDER BY orden", (clave,)):
+                self.hojas[hoja] = {}
+            for hoja, fila, numero in conn.execute(
+                "SELECT hoja, fila, numero FROM facturas WHERE ruta = ? ORDER BY hoja, fila", (clave,)
+            ):
+                self.hojas.setdefault(hoja, {}).setdefault(numero, fila)
+        finally:
+            conn.close()
+        self.huella = huella
+        return True
+
+    def vigente(self):
+        return os.path.exists(self.ruta) and self.huella == huella_archivo(self.ruta)
+
+    def buscar(self, numero, hoja=None):
+        hojas = [hoja] if hoja is not None else list(self.hojas)
+        for nombre in hojas:
+            fila = self.hojas.get(nombre, {}).get(str(numero))
+            if fila is not None:
+                return (self.anio, nombre, fila)
+        return None
+
+    def buscar_fila(self, hoja, numero):
+        return self.hojas.get(hoja, {}).get(str(numero))
+
+    def numeros(self, hoja):
+        return self.hojas.get(hoja, {}).keys()
+
+    def registrar(self, hoja, numero, fila):
+        # Llamar al agregar filas para que el indice siga al workbook en memoria.
+        # Queda invalidado hasta confirmar_guardado() por si el guardado falla
+        self.hojas.setdefault(hoja, {}).setdefault(str(numero), fila)
+        self.huella = None
+
+    def confirmar_guardado(self):
+        # Llamar despues de wb.save() para no reconstruir el indice en el proximo uso
+        self.huella = huella_archivo(self.ruta)
+
+
+def confirmar_guardado_indice(ruta):
+    indice = _INDICES_NUMEROS.get(ruta)
+    if indice is not None:
+        indice.confirmar_guardado()
+
+
+def obtener_indice_numeros(ruta, anio=None):
+    indice = _INDICES_NUMEROS.get(ruta)
+    if indice is None or not indice.vigente():
+        if anio is None:
+            # CONTROL/<anio>/CONTROL_<anio>.xlsx
+            anio = os.path.splitext(os.path.basename(ruta))[0].replace("CONTROL_", "")
+            anio = int(anio) if anio.isdigit() else anio
+        indice = IndiceNumeros(ruta, anio).construir()
+        _INDICES_NUMEROS[ruta] = indice
+    return indice
+
+
+
+#----------------------------
+# LIBROS CONTROL EN MEMORIA
+#----------------------------
+# En modo vigilancia los CONTROL quedan cargados entre archivos: {ruta: (huella, workbook)}
+MANTENER_LIBROS_ABIERTOS = False
+_LIBROS_CONTROL = {}
+
+
+def cargar_libro_control(ruta):
+    # El libro en cache se entrega solo si el archivo no cambio desde que se guardo; se saca
+    # de la cache para que un error a mitad de cambios no deje un libro a medio modificar
+    huella, wb = _LIBROS_CONTROL.pop(ruta, (None, None))
+    if wb is not None and huella == huella_archivo(ruta):
+        return wb
+    return abrir_libro(ruta)
+
+
+def guardar_libro_control(ruta, wb):
+    guardar_libro(wb, ruta)
+    if MANTENER_LIBROS_ABIERTOS:
+        _LIBROS_CONTROL[ruta] = (huella_archivo(ruta), wb)
+
+
+
+
+#-------------------------------------
+# INDICE SQLITE (espejo de los CONTROL)
+#-------------------------------------
+# Cambiar la version obliga a reconstruir el indice desde los xlsx
+VERSION_INDICE = 4
+
+# Procesos para escanear los CONTROL de distintos años en paralelo
+MAX_PROCESOS_ESCANEO = os.cpu_count() or 1
+
+# Estado de la factura segun el color de la celda FECHA (filas sin columna ESTADO)
+ESTADOS_POR_COLOR = {"93C47D": "PAGADO", "F6B26B": "DIFERENCIA", "FF4040": "NO PAGADO"}
+
+
+def conectar_indice():
+    os.makedirs(os.path.dirname(INDICE_DB), exist_ok=True)
+    conn = sqlite3.connect(INDICE_DB)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version != VERSION_INDICE:
+        conn.executescript("""
+            DROP TABLE IF EXISTS archivos;
+            DROP TABLE IF EXISTS hojas;
+            DROP TABLE IF EXISTS facturas;
+            DROP TABLE IF EXISTS fragmentos_no_pagadas;
+            DROP TABLE IF EXISTS reporte_no_pagadas;
+        """)
+    conn.executescript(f"""
+        CREATE TABLE IF NOT EXISTS archivos (
+            ruta TEXT PRIMARY KEY,
+            anio TEXT,
+            mtime_ns INTEGER,
+            tamano INTEGER,
+            hash TEXT
+        );
+        CREATE TABLE IF NOT EXISTS hojas (
+            ruta TEXT,
+            hoja TEXT,
+            orden INTEGER,
+            completa INTEGER,
+            encabezados TEXT,
+            PRIMARY KEY (ruta, hoja)
+        );
+        CREATE TABLE IF NOT EXISTS facturas (
+            ruta TEXT,
+            hoja TEXT,
+            fila INTEGER,
+            celda TEXT,
+            fecha TEXT,
+            numero TEXT,
+            monto,
+            pagado,
+            fecha_pago TEXT,
+            color TEXT,
+            estado TEXT,
+            negrita INTEGER,
+            valores TEXT,
+            PRIMARY KEY (ruta, hoja, fila)
+        );
+        CREATE TABLE IF NOT EXISTS fragmentos_no_pagadas (
+            ruta TEXT PRIMARY KEY,
+            huella TEXT,
+            filas TEXT
+        );
+        CREATE TABLE IF NOT EXISTS reporte_no_pagadas (
+            firma TEXT,
+            mtime_ns INTEGER,
+            tamano INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_facturas_numero ON facturas (numero);
+        CREATE INDEX IF NOT EXISTS idx_facturas_estado ON facturas (estado);
+        CREATE INDEX IF NOT EXISTS idx_facturas_negrita ON facturas (negrita);
+        PRAGMA user_version = {VERSION_INDICE};
+    """)
+    return conn
+
+
+def clave_archivo_indice(ruta, control_dir=None):
+    # Ruta relativa a la carpeta CONTROL indexada para que el indice no dependa del directorio de trabajo
+    return os.path.relpath(os.path.abspath(ruta), os.path.abspath(control_dir or CONTROL_DIR))
+
+
+def hash_archivo(ruta):
+    h = hashlib.sha1()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def color_celda(cell):
+    fill = getattr(cell, "fill", None)
+    rgb = fill.start_color.rgb if fill is not None else None
+    if rgb and isinstance(rgb, str):
+        return rgb[-6:].upper()
+    return None
+
+
+def _json_celda(valor):
+    # Tipos de celda que JSON no tiene, marcados para volver al mismo tipo al leerlos
+    if isinstance(valor, datetime):
+        return {"$datetime": valor.isoformat()}
+    if isinstance(valor, date):
+        return {"$date": valor.isoformat()}
+    if isinstance(valor, hora):
+        return {"$time": valor.isoformat()}
+    if isinstance(valor, timedelta):
+        return {"$timedelta": valor.total_seconds()}
+    return str(valor)
+
+
+def _celda_json(objeto):
+    if len(objeto) == 1:
+        (marca, valor), = objeto.items()
+        if marca == "$datetime":
+            return datetime.fromisoformat(valor)
+        if marca == "$date":
+            return date.fromisoformat(valor)
+        if marca == "$time":
+            return hora.fromisoformat(valor)
+        if marca == "$timedelta":
+            return timedelta(seconds=valor)
+    return objeto
+
+
+def a_json(valores):
+    # Valores de celdas para el indice. JSON y no pickle: el indice esta en una carpeta que el
+    # usuario puede tocar y cargar un pickle editado ejecuta codigo
+    return json.dumps(valores, default=_json_celda, ensure_ascii=False)
+
+
+def desde_json(texto):
+    return json.loads(texto, object_hook=_celda_json)
+
+
+def _valor_sql(valor):
+    if valor is None or isinstance(valor, (int, float, str)):
+        return valor
+    return str(valor)
+
+
+def escanear_archivo_control(ruta):
+    # Lectura en streaming (read_only) de un CONTROL: valores, color de FECHA y negrita.
+    # El color y la negrita se resuelven una vez por relleno y por fuente y no por celda: el libro
+    # guarda cada fill/font una sola vez y todas las celdas con ese estilo devuelven el mismo objeto
+    hojas = []
+    facturas = []
+    colores_relleno = {}
+    negrita_fuente = {}
+
+    def color(cell):
+        fill = getattr(cell, "fill", None)
+        if fill is None:
+            return None
+        if id(fill) not in colores_relleno:
+            colores_relleno[id(fill)] = color_celda(cell)
+        return colores_relleno[id(fill)]
+
+    def en_negrita(cell):
+        font = getattr(cell, "font", None)
+        if font is None:
+            return False
+        if id(font) not in negrita_fuente:
+            negrita_fuente[id(font)] = bool(font.bold)
+        return negrita_fuente[id(font)]
+
+    wb = load_workbook(ruta, read_only=True)
+    try:
+        for orden, ws in enumerate(wb.worksheets):
+            filas = ws.iter_rows(min_row=1)
+            encabezados = [cell.value for cell in next(filas, ())]
+            normalizados = [v.strip().upper() if isinstance(v, str) else "" for v in encabezados]
+            indices = {col: normalizados.index(col) if col in normalizados else None
+                       for col in ("FECHA", "MONTO", "PAGADO", "FECHA PAGO", "ESTADO")}
+            completa = all(indices[col] is not None for col in ("FECHA", "MONTO", "PAGADO"))
+            hojas.append((ws.title, orden, int(completa), a_json(encabezados)))
+
+            def valor(row, col):
+                i = indices[col]
+                return row[i].value if i is not None and i < len(row) else None
+
+            for fila_num, row in enumerate(filas, start=2):
+                if not row:
+                    continue
+                valores = [cell.value for cell in row]
+                fecha_idx = indices["FECHA"] if indices["FECHA"] is not None else 0
+                color_fecha = color(row[fecha_idx]) if fecha_idx < len(row) else None
+                negrita = any(en_negrita(cell) for cell in row)
+
+                # El estado sale de la columna ESTADO; las filas sin ella (CONTROL sin migrar) por color
+                estado = valor(row, "ESTADO")
+                if estado not in COLORES_ESTADO:
+                    estado = ESTADOS_POR_COLOR.get(color_fecha)
+                facturas.append((
+                    ws.title,
+                    fila_num,
+                    f"B{fila_num}",
+                    _valor_sql(valor(row, "FECHA")),
+                    str(valores[1] if len(valores) > 1 else None),
+                    _valor_sql(valor(row, "MONTO")),
+                    _valor_sql(valor(row, "PAGADO")),
+                    _valor_sql(valor(row, "FECHA PAGO")),
+                    color_fecha,
+                    estado,
+                    int(bool(negrita)),
+                    a_json(valores),
+                ))
+    finally:
+        wb.close()
+    return hojas, facturas
+
+
+def _guardar_escaneo_indice(conn, clave, anio, huella, hash_actual, hojas, facturas):
+    conn.execute("DELETE FROM hojas WHERE ruta = ?", (clave,))
+    conn.execute("DELETE FROM facturas WHERE ruta = ?", (clave,))
+    conn.executemany(
+        "INSERT INTO hojas VALUES (?, ?, ?, ?, ?)",
+        [(clave,) + hoja for hoja in hojas]
+    )
+    conn.executemany(
+        "INSERT INTO facturas VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(clave,) + factura for factura in facturas]
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO archivos VALUES (?, ?, ?, ?, ?)",
+        (clave, anio, huella[0], huella[1], hash_actual)
+    )
+
+
+def listar_archivos_control(control_dir=None):
+    control_dir = control_dir or CONTROL_DIR
+    rutas = []
+    for root, dirs, files in os.walk(control_dir):
+        for file in files:
+            if file.endswith(".xlsx") and file.startswith("CONTROL_"):
+                rutas.append(os.path.join(root, file))
+    return sorted(rutas)
+
+
+def mapear_en_procesos(funcion, tareas, max_procesos):
+    # pool.map repartido entre procesos, con los resultados en el orden de las tareas.
+    # Devuelve None si el pool no arranca (crear el executor o lanzar sus procesos) o se rompe;
+    # el error de una tarea se propaga igual que sin pool
+    try:
+        pool = ProcessPoolExecutor(max_workers=min(len(tareas), max_procesos))
+    except OSError:
+        return None
+    with pool:
+        try:
+            resultados = pool.map(funcion, tareas)
+        except (OSError, BrokenProcessPool):
+            return None
+        try:
+            return list(resultados)
+        except BrokenProcessPool:
+            return None
+
+
+def escanear_archivos_control(rutas):
+    # Reparte los CONTROL entre procesos; con un solo archivo no vale la pena el pool.
+    # Sin pool disponible se escanea en el proceso actual
+    if len(rutas) <= 1 or MAX_PROCESOS_ESCANEO <= 1:
+        return [escanear_archivo_control(ruta) for ruta in rutas]
+    resultados = mapear_en_procesos(escanear_archivo_control, rutas, MAX_PROCESOS_ESCANEO)
+    if resultados is None:
+        return [escanear_archivo_control(ruta) for ruta in rutas]
+    return resultados
+
+
+def sincronizar_indice_control(conn, control_dir=None):
+    # Refresca solo los CONTROL que cambiaron (mtime/tamaño y luego hash)
+    rutas = listar_archivos_control(control_dir)
+    registrados = {
+        ruta: (mtime_ns, tamano, hash_guardado)
+        for ruta, mtime_ns, tamano, hash_guardado in conn.execute(
+            "SELECT ruta, mtime_ns, tamano, hash FROM archivos"
+        )
+    }
+    vigentes = set()
+    a_escanear = []
+
+    for ruta in rutas:
+        clave = clave_archivo_indice(ruta, control_dir)
+        vigentes.add(clave)
+        huella = huella_archivo(ruta)
+        registro = registrados.get(clave)
+        if registro and registro[:2] == huella:
+            continue
+
+        hash_actual = hash_archivo(ruta)
+        if registro and registro[2] == hash_actual:
+            conn.execute(
+                "UPDATE archivos SET mtime_ns = ?, tamano = ? WHERE ruta = ?",
+                (huella[0], huella[1], clave)
+            )
+            continue
+
+        anio = os.path.basename(os.path.dirname(ruta))
+        a_escanear.append((ruta, clave, anio, huella, hash_actual))
+
+    # Cada año se escanea en su propio proceso y se guarda en orden de año
+    resultados = escanear_archivos_control([ruta for ruta, *_ in a_escanear])
+    for (ruta, clave, anio, huella, hash_actual), (hojas, facturas) in zip(a_escanear, resultados):
+        _guardar_escaneo_indice(conn, clave, anio, huella, hash_actual, hojas, facturas)
+
+    # Archivos que ya no existen
+    for clave in set(registrados) - vigentes:
+        conn.execute("DELETE FROM archivos WHERE ruta = ?", (clave,))
+        conn.execute("DELETE FROM hojas WHERE ruta = ?", (clave,))
+        conn.execute("DELETE FROM facturas WHERE ruta = ?", (clave,))
+
+    conn.commit()
+    return rutas
+
+
+def consultar_facturas_indice(estados=None, negrita=None, control_dir=None):
+    # Devuelve (ruta, hoja, fila, encabezados, valores, color) desde el indice
+    control_dir = control_dir or CONTROL_DIR
+    conn = conectar_indice()
+    try:
+        sincronizar_indice_control(conn, control_dir)
+        hojas = {
+            (ruta, hoja): (orden, completa, desde_json(encabezados))
+            for ruta, hoja, orden, completa, encabezados in conn.execute("SELECT * FROM hojas")
+        }
+        consulta = "SELECT ruta, hoja, fila, color, valores FROM facturas WHERE 1 = 1"
+        parametros = []
+        if estados is not None:
+            consulta += f" AND estado IN ({', '.join('?' * len(estados))})"
+            parametros.extend(estados)
+        if negrita is not None:
+            consulta += " AND negrita = ?"
+            parametros.append(int(negrita))
+
+        resultado = []
+        for ruta, hoja, fila, color, valores in conn.execute(consulta, parametros):
+            orden, completa, encabezados = hojas[(ruta, hoja)]
+            resultado.append({
+                "archivo": os.path.join(control_dir, ruta),
+                "hoja": hoja,
+                "orden": orden,
+                "completa": bool(completa),
+                "fila": fila,
+                "encabezados": encabezados,
+                "valores": desde_json(valores),
+                "color": color,
+            })
+    finally:
+        conn.close()
+
+    resultado.sort(key=lambda r: (r["archivo"], r["orden"], r["fila"]))
+    return resultado
+
+
+
+
+#-------------------------------------
+# MIGRACION COLUMNA ESTADO
+#-------------------------------------
+def migrar_columna_estado(control_dir=None, log_callback=None):
+    # Completa la columna ESTADO de los CONTROL existentes a partir del color de FECHA.
+    # Las filas que ya tienen un estado valido no se tocan; se puede correr varias veces
+    log = log_callback if log_callback else default_log
+    total = 0
+    for ruta in listar_archivos_control(control_dir):
+        wb = abrir_libro(ruta)
+        autoajuste = AutoAjusteColumnas()
+        completadas = 0
+        for ws in wb.worksheets:
+            if ws.title.upper().startswith("TEMP"):
+                continue
+            encabezados = next(ws.iter_rows(min_row=1, max_row=1, values_only=True), ())
+            normalizados = [v.strip().upper() if isinstance(v, str) else "" for v in encabezados]
+            if "FECHA" not in normalizados:
+                continue
+            fecha_idx = normalizados.index("FECHA")
+            col_estado = columna_estado(ws)
+            autoajuste.actualizar(ws, [ws.cell(row=1, column=col_estado)])
+
+            for row in ws.iter_rows(min_row=2, max_col=max(fecha_idx + 1, col_estado)):
+                if all(cell.value is None for cell in row):
+                    continue
+                celda_estado = row[col_estado - 1]
+                if celda_estado.value in COLORES_ESTADO:
+                    continue
+                estado = ESTADOS_POR_COLOR.get(color_celda(row[fecha_idx]))
+                if estado is None:
+                    continue
+                celda_estado.value = estado
+                celda_estado.fill = relleno_estado(estado)
+                celda_estado.alignment = Alignment(horizontal="center", vertical="center")
+                autoajuste.actualizar(ws, [celda_estado])
+                completadas += 1
+
+        if completadas:
+            autoajuste.aplicar(wb)
+            guardar_libro(wb, ruta)
+            confirmar_guardado_indice(ruta)
+        log(f"{os.path.basename(ruta)}: {completadas} filas con ESTADO")
+        total += completadas
+    return total
+
+
+
+
+#-------------------------------------
+# LIBRO MAYOR COLUMNAR (opcional)
+#-------------------------------------
+# Una particion por año y hoja (mes) con estas columnas; ESTADO reemplaza al color de la fila
+COLUMNAS_LIBRO_MAYOR = COLUMNAS_FACTURA + ["ESTADO", "NEGRITA"]
+
+
+def _requerir_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            'El modo de almacenamiento "parquet" necesita pyarrow (pip install pyarrow). '
+            'Sin pyarrow usar CONTROL_ALMACENAMIENTO=excel.'
+        ) from None
+
+
+def _texto_libro(valor):
+    # Columnas de texto del libro mayor: fechas como DD/MM/AAAA y vacios como None
+    valor = _valor_excel(valor)
+    if isinstance(valor, datetime):
+        return valor.strftime("%d/%m/%Y")
+    return None if valor is None else str(valor)
+
+
+def _particion_libro_mayor(filas):
+    # filas: listas [FECHA, NUMERO, MONTO, PAGADO, FECHA PAGO, ESTADO, NEGRITA]
+    df = pd.DataFrame(filas, columns=COLUMNAS_LIBRO_MAYOR)
+    for col in ("FECHA", "NUMERO", "FECHA PAGO", "ESTADO"):
+        df[col] = df[col].map(_texto_libro).astype(object)
+    for col in ("MONTO", "PAGADO"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype(float)
+    df["NEGRITA"] = df["NEGRITA"].fillna(False).astype(bool)
+    return df
+
+
+class LibroMayor:
+    # Facturas en Parquet particionadas por año y mes. Las particiones se leen a demanda y solo
+    # se reescriben las modificadas; la vista Excel se regenera solo para los años que cambiaron
+    def __init__(self, carpeta=None):
+        _requerir_pyarrow()
+        self.carpeta = carpeta or LIBRO_MAYOR_DIR
+        self.particiones = {}  # {(anio, hoja): DataFrame}
+        self.modificadas = set()
+        self.ruta_vistas = os.path.join(self.carpeta, "vistas.json")
+
+    def ruta_particion(self, anio, hoja):
+        return os.path.join(self.carpeta, str(anio), f"{hoja}.parquet")
+
+    def anios(self):
+        if not os.path.isdir(self.carpeta):
+            return []
+        return sorted(int(d) for d in os.listdir(self.carpeta) if d.isdigit())
+
+    def hojas(self, anio):
+        # Hojas del año en orden de calendario (las que no son meses, al final)
+        carpeta = os.path.join(self.carpeta, str(anio))
+        hojas = {os.path.splitext(f)[0] for f in os.listdir(carpeta) if f.endswith(".parquet")} if os.path.isdir(carpeta) else set()
+        hojas |= {hoja for (a, hoja) in self.particiones if a == anio}
+        orden_meses = {mes: i for i, mes in MESES_ES.items()}
+        return sorted(hojas, key=lambda hoja: (orden_meses.get(hoja, 13), hoja))
+
+    def existe(self, anio, hoja):
+        return (anio, hoja) in self.particiones or os.path.exists(self.ruta_particion(anio, hoja))
+
+    def leer(self, anio, hoja):
+        clave = (anio, hoja)
+        if clave not in self.particiones:
+            ruta = self.ruta_particion(anio, hoja)
+            self.particiones[clave] = pd.read_parquet(ruta) if os.path.exists(ruta) else _particion_libro_mayor([])
+        return self.particiones[clave]
+
+    def posiciones(self, anio, hoja):
+        # {NUMERO: posicion en la particion}, gana la primera aparicion como en el indice de numeros
+        numeros = self.leer(anio, hoja)["NUMERO"].astype(str)
+        primeras = ~numeros.duplicated()
+        return dict(zip(numeros[primeras], np.flatnonzero(primeras.to_numpy())))
+
+    def agregar(self, anio, hoja, filas):
+        nuevas = _particion_libro_mayor(filas)
+        actual = self.leer(anio, hoja)
+        self.particiones[(anio, hoja)] = nuevas if actual.empty else pd.concat([actual, nuevas], ignore_index=True)
+        self.modificadas.add((anio, hoja))
+
+    def actualizar(self, anio, hoja, posicion, valores):
+        df = self.leer(anio, hoja)
+        for col, valor in valores.items():
+            if col in ("MONTO", "PAGADO"):
+                valor = pd.to_numeric(valor, errors="coerce")
+            df.iat[posicion, df.columns.get_loc(col)] = valor
+        self.modificadas.add((anio, hoja))
+
+    def reemplazar_anio(self, anio, hojas):
+        # hojas: {hoja: DataFrame}; borra las particiones del año que ya no estan
+        carpeta = os.path.join(self.carpeta, str(anio))
+        if os.path.isdir(carpeta):
+            for archivo in os.listdir(carpeta):
+                if archivo.endswith(".parquet") and os.path.splitext(archivo)[0] not in hojas:
+                    os.remove(os.path.join(carpeta, archivo))
+        for clave in [c for c in self.particiones if c[0] == anio]:
+            del self.particiones[clave]
+        for hoja, df in hojas.items():
+            self.particiones[(anio, hoja)] = df
+            self.modificadas.add((anio, hoja))
+
+    def guardar(self):
+        # Escribe solo las particiones modificadas (archivo temporal + reemplazo) y devuelve sus años
+        anios = set()
+        for anio, hoja in sorted(self.modificadas, key=str):
+            ruta = self.ruta_particion(anio, hoja)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            self.particiones[(anio, hoja)].to_parquet(ruta + ".tmp", index=False)
+            os.replace(ruta + ".tmp", ruta)
+            anios.add(anio)
+        self.modificadas = set()
+        return anios
+
+    # ---- Vista Excel ----
+    def _huellas_vistas(self):
+        if not os.path.exists(self.ruta_vistas):
+            return {}
+        with open(self.ruta_vistas, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _registrar_vista(self, anio, ruta):
+        huellas = self._huellas_vistas()
+        huellas[str(anio)] = list(huella_archivo(ruta))
+        os.makedirs(self.carpeta, exist_ok=True)
+        with open(self.ruta_vistas, "w", encoding="utf-8") as f:
+            json.dump(huellas, f)
+
+    def sincronizar_vista(self, anio, log_callback=None):
+        # Si el CONTROL del año se edito en Excel despues de generarlo (marcar pagadas, negritas,
+        # cambios a mano) o nunca se importo, sus datos se vuelven a tomar desde el xlsx.
+        # Un xlsx borrado, o recreado solo con la hoja TEMP, no borra las particiones: la
+        # vista se vuelve a generar desde ellas
+        ruta = os.path.join(CONTROL_DIR, str(anio), f"CONTROL_{anio}.xlsx")
+        if not os.path.exists(ruta):
+            if self.hojas(anio):
+                self.generar_vista(anio)
+                if log_callback:
+                    log_callback(f"Vista regenerada desde el libro mayor: {ruta}")
+            return False
+        if self._huellas_vistas().get(str(anio)) == list(huella_archivo(ruta)):
+            return False
+        hojas, facturas = escanear_archivo_control(ruta)
+        particiones = _hojas_desde_escaneo(hojas, facturas)
+        if not particiones:
+            if self.hojas(anio):
+                self.generar_vista(anio)
+                if log_callback:
+                    log_callback(f"Vista regenerada desde el libro mayor: {ruta}")
+            return False
+        self.reemplazar_anio(anio, particiones)
+        self.guardar()
+        self._registrar_vista(anio, ruta)
+        if log_callback:
+            log_callback(f"Libro mayor actualizado desde {ruta}")
+        return True
+
+    def generar_vista(self, anio):
+        # Regenera CONTROL_<anio>.xlsx en una sola escritura (write-only) desde las particiones
+        ruta = os.path.join(CONTROL_DIR, str(anio), f"CONTROL_{anio}.xlsx")
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        wb = Workbook(write_only=True)
+        alineacion = Alignment(horizontal="center", vertical="center")
+
+        # Un estilo por (estado, negrita), armado una vez y puesto en cada celda
+        estilos = {}
+
+        def estilo(estado, negrita):
+            if (estado, negrita) not in estilos:
+                estilos[(estado, negrita)] = {"alignment": alineacion}
+                if estado in COLORES_ESTADO:
+                    estilos[(estado, negrita)]["fill"] = relleno_estado(estado)
+                if negrita:
+                    estilos[(estado, negrita)]["font"] = Font(bold=True)
+            return estilos[(estado, negrita)]
+
+        for hoja in self.hojas(anio):
+            df = self.leer(anio, hoja)
+            ws = wb.create_sheet(hoja)
+            filas = [
+                [_valor_excel(v) for v in fila]
+                for fila in df[ENCABEZADOS_CONTROL].itertuples(index=False, name=None)
+            ]
+
+            # Anchos calculados antes de escribir (en write-only van antes de las filas)
+            anchos = [len(h) for h in ENCABEZADOS_CONTROL]
+            for fila in filas:
+                for idx, valor in enumerate(fila):
+                    anchos[idx] = max(anchos[idx], _largo_celda(valor))
+            for idx, ancho in enumerate(anchos, start=1):
+                ws.column_dimensions[get_column_letter(idx)].width = ancho + MARGEN_ANCHO_COLUMNA
+
+            ws.append([celda_con_estilo(ws, valor, estilo(None, False)) for valor in ENCABEZADOS_CONTROL])
+
+            for fila, estado, negrita in zip(filas, df["ESTADO"], df["NEGRITA"]):
+                estilo_fila = estilo(estado if isinstance(estado, str) else None, bool(negrita))
+                ws.append([celda_con_estilo(ws, valor, estilo_fila) for valor in fila])
+
+        if not wb.worksheets:
+            wb.create_sheet("TEMP").append(ENCABEZADOS_CONTROL)
+        guardar_libro(wb, ruta)
+        self._registrar_vista(anio, ruta)
+        return ruta
+
+
+def _hojas_desde_escaneo(hojas, facturas):
+    # Particiones de un año a partir de escanear_archivo_control: el estado sale del color
+    # de la celda FECHA y la negrita de la fila. La hoja TEMP de un CONTROL recien creado no cuenta
+    columnas = {}
+    for titulo, _, completa, encabezados in hojas:
+        if not completa or titulo == "TEMP":
+            continue
+        normalizados = [v.strip().upper() if isinstance(v, str) else "" for v in desde_json(encabezados)]
+        columnas[titulo] = [normalizados.index(col) if col in normalizados else None for col in COLUMNAS_FACTURA]
+        columnas[titulo][1] = 1  # NUMERO siempre en la columna B, como en el indice de numeros
+
+    filas_por_hoja = {titulo: [] for titulo in columnas}
+    for hoja, _, _, _, _, _, _, _, _, estado, negrita, valores in facturas:
+        if hoja not in columnas:
+            continue
+        valores = desde_json(valores)
+        if all(v is None for v in valores):
+            continue
+        fila = [valores[i] if i is not None and i < len(valores) else None for i in columnas[hoja]]
+        filas_por_hoja[hoja].append(fila + [estado, bool(negrita)])
+    return {hoja: _particion_libro_mayor(filas) for hoja, filas in filas_por_hoja.items()}
+
+
+def importar_libro_mayor(control_dir=None, log_callback=None):
+    # Importacion inicial (o re-importacion) de todo el arbol CONTROL al libro mayor
+    log_callback = log_callback or default_log
+    libro = LibroMayor()
+    rutas = listar_archivos_control(control_dir)
+    for ruta, (hojas, facturas) in zip(rutas, escanear_archivos_control(rutas)):
+        anio = os.path.basename(os.path.dirname(ruta))
+        anio = int(anio) if anio.isdigit() else anio
+        particiones = _hojas_desde_escaneo(hojas, facturas)
+        if not particiones:
+            log_callback(f"Sin hojas para importar en {ruta}, se conservan las particiones del año")
+            continue
+        libro.reemplazar_anio(anio, particiones)
+        libro.guardar()
+        libro._registrar_vista(anio, ruta)
+        log_callback(f"Importado {ruta}: {sum(len(df) for df in particiones.values())} facturas en {len(particiones)} hojas")
+    return libro
+
+
+def _anio_control(archivo_control):
+    # CONTROL/<anio>/CONTROL_<anio>.xlsx
+    anio = os.path.splitext(os.path.basename(archivo_control))[0].replace("CONTROL_", "")
+    return int(anio) if anio.isdigit() else anio
+
+
+def agregar_control_libro_mayor(archivo_control, df_agregar, archivo_agregar, log_wrapper, errores_detallados):
+    libro = LibroMayor()
+    anio = _anio_control(archivo_control)
+    libro.sincronizar_vista(anio, log_wrapper)
+
+    def numeros_hoja(hoja):
+        return libro.posiciones(anio, hoja).keys() if libro.existe(anio, hoja) else []
+
+    nuevas_por_hoja, filas_agregadas, filas_omitidas = separar_filas_nuevas(
+        df_agregar, numeros_hoja, archivo_agregar, log_wrapper, errores_detallados
+    )
+    for hoja, nuevas_filas in nuevas_por_hoja.items():
+        if nuevas_filas or not libro.existe(anio, hoja):
+            libro.agregar(anio, hoja, [fila + ["NO PAGADO", False] for fila in nuevas_filas])
+
+    for anio_modificado in libro.guardar():
+        libro.generar_vista(anio_modificado)
+    log_wrapper(f"Archivo CONTROL actualizado: {filas_agregadas} filas agregadas, {filas_omitidas} filas omitidas.")
+    return {"filas_agregadas": filas_agregadas, "filas_omitidas": filas_omitidas}
+
+
+def agregar_pago_libro_mayor(df_pago, nuevo_destino, log_wrapper, errores_detallados):
+    libro = LibroMayor()
+    # Los mismos años que va a buscar conciliar_pagos
+    fechas = parsear_fechas_pago(df_pago["FECHA"])
+    for anio in sorted(set(fechas.dt.year.dropna().astype(int))):
+        libro.sincronizar_vista(anio, log_wrapper)
+
+    facturas_actualizadas = 0
+    for evento in conciliar_pagos(df_pago, nuevo_destino, libro=libro):
+        cambio = evento.get("cambio")
+        if cambio:
+            facturas_actualizadas += 1
+            libro.actualizar(cambio["anio"], cambio["hoja"], cambio["fila"], {
+                "ESTADO": cambio["estado"],
+                "PAGADO": cambio["pagado"],
+                "FECHA PAGO": cambio["fecha_pago"],
+            })
+        if evento.get("error"):
+            errores_detallados.append(evento["error"])
+        log_wrapper(evento["mensaje"])
+
+    for anio in libro.guardar():
+        libro.generar_vista(anio)
+    return {"facturas_actualizadas": facturas_actualizadas}
+
+
+def filas_no_pagadas_libro_mayor():
+    # Mismas filas que el reporte desde el indice, pero leidas de las particiones por ESTADO
+    libro = LibroMayor()
+    for anio in {_anio_control(ruta) for ruta in listar_archivos_control()}:
+        libro.sincronizar_vista(anio)
+    for anio in libro.anios():
+        for hoja in libro.hojas(anio):
+            df = libro.leer(anio, hoja)
+            df = df[df["ESTADO"].isin(["DIFERENCIA", "NO PAGADO"])]
+            for fila, estado in zip(df[COLUMNAS_FACTURA].itertuples(index=False, name=None), df["ESTADO"]):
+                fila = [_valor_excel(v) for v in fila]
+                monto = fila[2] or 0
+                pagado = fila[3] or 0
+                diferencia = None
+                porcentaje = None
+                if estado == "DIFERENCIA":
+                    diferencia = monto - pagado
+                    if monto != 0:
+                        porcentaje = f"%{round((diferencia / monto) * 100, 2)}"
+                    else:
+                        porcentaje = "%0.00"
+                yield fila + [diferencia, porcentaje], "F6B26B" if estado == "DIFERENCIA" else "FF4040"
+
+
+
+
 #----------------------
 # FACTUAS NO PAGADAS 
 #---------------------
 
 
-def FacturasNoPagadas():
+def filas_reporte_no_pagadas(conn, clave):
+    # Fragmento del reporte de un solo CONTROL: [(fila con diferencia y porcentaje, color)]
+    hojas = {
+        hoja: desde_json(encabezados)
+        for hoja, encabezados in conn.execute(
+            "SELECT hoja, encabezados FROM hojas WHERE ruta = ? AND completa = 1", (clave,)
+        )
+    }
+    filas = []
+    indices_hoja = {}
+    for hoja, estado, valores in conn.execute(
+        """SELECT f.hoja, f.estado, f.valores FROM facturas f
+           JOIN hojas h ON h.ruta = f.ruta AND h.hoja = f.hoja
+           WHERE f.ruta = ? AND f.estado IN ('DIFERENCIA', 'NO PAGADO')
+           ORDER BY h.orden, f.fila""",
+        (clave,)
+    ):
+        if hoja not in hojas:
+            continue  # Si no encuentra columnas requeridas, pasa a la siguiente hoja
+
+        if hoja not in indices_hoja:
+            # Detectar indice de columnas dinamicamente
+            ws_headers = [v.strip().upper() if isinstance(v, str) else "" for v in hojas[hoja]]
+            estado_idx = ws_headers.index("ESTADO") if "ESTADO" in ws_headers else None
+            indices_hoja[hoja] = (ws_headers.index("MONTO"), ws_headers.index("PAGADO"), estado_idx)
+        monto_idx, pagado_idx, estado_idx = indices_hoja[hoja]
+
+        row = desde_json(valores)
+
+        # Obtener valores
+        monto = row[monto_idx] or 0
+        pagado = row[pagado_idx] or 0
+        diferencia = None
+        porcentaje = None
+
+        if estado == "DIFERENCIA":
+            diferencia = monto - pagado
+            if monto != 0:
+                porcentaje_val = (diferencia / monto) * 100
+                porcentaje = f"%{round(porcentaje_val, 2)}"
+            else:
+                porcentaje = "%0.00"
+
+        # Copiar fila sin la columna ESTADO (el reporte la muestra con el color)
+        nueva_fila = [v for i, v in enumerate(row) if i != estado_idx]
+        nueva_fila.extend([diferencia, porcentaje])
+        filas.append((nueva_fila, "F6B26B" if estado == "DIFERENCIA" else "FF4040"))
+    return filas
+
 
+def escribir_reporte_no_pagadas(filas):
+    # filas: (fila con diferencia y porcentaje, color) en el orden en que van en el reporte.
+    # Se escribe en modo write-only: los anchos se calculan antes, desde los valores
     color_diferencia = PatternFill(start_color="F6B26B", end_color="F6B26B", fill_type="solid")
     color_rojo = PatternFill(start_color="FF4040", end_color="FF4040", fill_type="solid")
+    alineacion = Alignment(horizontal="center", vertical="center")
 
-    wb_out = Workbook()
-    ws_out = wb_out.active
-    ws_out.title = "NoPagadas"
-
-    # Encabezado
     encabezado = ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHAPAGO", "DIFERENCIA", "PORCENTAJE"]
-    ws_out.append(encabezado)
-    for idx, _ in enumerate(encabezado, start=1):
-        ws_out.cell(row=1, column=idx).alignment = Alignment(horizontal="center", vertical="center")
+    filas = list(filas)
+
+    # Ancho de cada columna: su valor mas largo + 8
+    anchos = [0] * max([len(encabezado)] + [len(nueva_fila) for nueva_fila, _ in filas])
+    for fila in [encabezado] + [nueva_fila for nueva_fila, _ in filas]:
+        for idx, valor in enumerate(fila):
+            if valor is not None:
+                anchos[idx] = max(anchos[idx], len(str(valor)))
+
+    wb_out = Workbook(write_only=True)
+    ws_out = wb_out.create_sheet("NoPagadas")
+    for idx, ancho in enumerate(anchos, start=1):
+        ws_out.column_dimensions[get_column_letter(idx)].width = ancho + 8
+
+    # Encabezado centrado; cada fila con el color de su estado y centrada
+    ws_out.append([celda_con_estilo(ws_out, valor, {"alignment": alineacion}) for valor in encabezado])
+    estilos = {
+        "F6B26B": {"fill": color_diferencia, "alignment": alineacion},
+        "FF4040": {"fill": color_rojo, "alignment": alineacion},
+    }
+    for nueva_fila, fill_color in filas:
+        estilo = estilos["F6B26B" if fill_color == "F6B26B" else "FF4040"]
+        ws_out.append([celda_con_estilo(ws_out, valor, estilo) for valor in nueva_fila])
 
-    # Recorrer archivos CONTROL_
-    for root, dirs, files in os.walk(CONTROL_DIR):
-        for file in files:
-            if file.endswith(".xlsx") and file.startswith("CONTROL_"):
-                ruta = os.path.join(root, file)
-                wb = load_workbook(ruta)
-                for ws in wb.worksheets:
-                    # Detectar indice de columnas dinamicamente
-                    ws_headers = [cell.value.strip().upper() if isinstance(cell.value, str) else "" for cell in ws[1]]
-                    try:
-                        fecha_idx = ws_headers.index("FECHA")
-                        monto_idx = ws_headers.index("MONTO")
-                        pagado_idx = ws_headers.index("PAGADO")
-                    except ValueError:
-                        continue  # Si no encuentra columnas requeridas, pasa a la siguiente hoja
-
-                    for row in ws.iter_rows(min_row=2, values_only=False):
-                        fecha_cell = row[fecha_idx]
-                        fill_color = fecha_cell.fill.start_color.rgb
-                        if fill_color:
-                            fill_color = fill_color[-6:].upper()
-                        else:
-                            continue
+    os.makedirs(os.path.dirname(OUTPUT_FILE_FACTURASNOPAGADAS), exist_ok=True)
+    guardar_libro(wb_out, OUTPUT_FILE_FACTURASNOPAGADAS)
 
-                        if fill_color in ["F6B26B", "FF4040"]:
-                            # Obtener valores
-                            monto = row[monto_idx].value or 0
-                            pagado = row[pagado_idx].value or 0
-                            diferencia = None
-                            porcentaje = None
-
-                            if fill_color == "F6B26B":  
-                                diferencia = monto - pagado
-                                if monto != 0:
-                                    porcentaje_val = (diferencia / monto) * 100
-                                    porcentaje = f"%{round(porcentaje_val, 2)}"
-                                else:
-                                    porcentaje = "%0.00"
-
-                            # Copiar fila
-                            nueva_fila = [cell.value for cell in row]
-                            nueva_fila.extend([diferencia, porcentaje])
-                            ws_out.append(nueva_fila)
-
-                            # Aplicar color y centrar
-                            row_out_idx = ws_out.max_row
-                            for col_idx in range(1, len(nueva_fila) + 1):
-                                cell_out = ws_out.cell(row=row_out_idx, column=col_idx)
-                                if fill_color == "F6B26B":
-                                    cell_out.fill = color_diferencia
-                                else:
-                                    cell_out.fill = color_rojo
-                                cell_out.alignment = Alignment(horizontal="center", vertical="center")
-
-    # Ajustar ancho de columnas
-    for col in ws_out.columns:
-        max_length = 0
-        col_letter = col[0].column_letter
-        for cell in col:
-            if cell.value is not None:
-                max_length = max(max_length, len(str(cell.value)))
-        ws_out.column_dimensions[col_letter].width = max_length + 8
 
-    os.makedirs(os.path.dirname(OUTPUT_FILE_FACTURASNOPAGADAS), exist_ok=True)
-    wb_out.save(OUTPUT_FILE_FACTURASNOPAGADAS)
-    os.startfile(OUTPUT_FILE_FACTURASNOPAGADAS)
+def FacturasNoPagadas(abrir=True):
+    # abrir=False deja el reporte generado sin abrirlo (corridas sin ventanas)
+    # Con el libro mayor activo el reporte sale directo de las particiones
+    if MODO_ALMACENAMIENTO == "parquet":
+        escribir_reporte_no_pagadas(filas_no_pagadas_libro_mayor())
+        if abrir:
+            os.startfile(OUTPUT_FILE_FACTURASNOPAGADAS)
+        return
+
+    # Fragmentos por CONTROL guardados en el indice, se recalculan solo si cambio el hash del archivo
+    conn = conectar_indice()
+    try:
+        sincronizar_indice_control(conn, CONTROL_DIR)
+        archivos = conn.execute("SELECT ruta, tamano, mtime_ns, hash FROM archivos ORDER BY ruta").fetchall()
+        # Solo las huellas: las filas se leen de a un fragmento y solo si hay que reescribir el reporte
+        fragmentos = dict(conn.execute("SELECT ruta, huella FROM fragmentos_no_pagadas"))
+
+        # La sincronizacion ya resolvio tamaño/mtime y solo re-hashea lo que cambio de fecha,
+        # asi que un archivo tocado pero con el mismo contenido conserva su fragmento
+        firma = []
+        for ruta, tamano, mtime_ns, hash_archivo_control in archivos:
+            huella = f"{tamano}:{hash_archivo_control}"
+            if fragmentos.get(ruta) != huella:
+                filas = a_json(filas_reporte_no_pagadas(conn, ruta))
+                conn.execute(
+                    "INSERT OR REPLACE INTO fragmentos_no_pagadas VALUES (?, ?, ?)",
+                    (ruta, huella, filas)
+                )
+                fragmentos[ruta] = huella
+            firma.append(f"{ruta}|{huella}")
+
+        for ruta in set(fragmentos) - {ruta for ruta, *_ in archivos}:
+            conn.execute("DELETE FROM fragmentos_no_pagadas WHERE ruta = ?", (ruta,))
+            del fragmentos[ruta]
+
+        # Si ningun CONTROL cambio y el reporte no se toco, se reutiliza tal cual
+        firma = hashlib.sha1("\n".join(firma).encode("utf-8")).hexdigest()
+        salida = conn.execute("SELECT firma, mtime_ns, tamano FROM reporte_no_pagadas").fetchone()
+        reporte_al_dia = (
+            salida is not None and salida[0] == firma and
+            os.path.exists(OUTPUT_FILE_FACTURASNOPAGADAS) and
+            huella_archivo(OUTPUT_FILE_FACTURASNOPAGADAS) == tuple(salida[1:])
+        )
+
+        if not reporte_al_dia:
+            # Armar el reporte con los fragmentos en orden de año
+            escribir_reporte_no_pagadas(
+                fila for ruta, *_ in archivos
+                for fila in desde_json(conn.execute(
+                    "SELECT filas FROM fragmentos_no_pagadas WHERE ruta = ?", (ruta,)
+                ).fetchone()[0])
+            )
+
+            conn.execute("DELETE FROM reporte_no_pagadas")
+            conn.execute(
+                "INSERT INTO reporte_no_pagadas VALUES (?, ?, ?)",
+                (firma,) + huella_archivo(OUTPUT_FILE_FACTURASNOPAGADAS)
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+    if abrir:
+        os.startfile(OUTPUT_FILE_FACTURASNOPAGADAS)
 
 
 
@@ -607,60 +2174,73 @@ def actualizar_control_manualmente(control_dir):
     
     log_negrita = []
 
-    for root, dirs, files in os.walk(control_dir):
-        for file in files:
-            if file.endswith(".xlsx") and file.startswith("CONTROL_"):
-                ruta_archivo = os.path.join(root, file)
-                wb = load_workbook(ruta_archivo)
-
-                for ws in wb.worksheets:
-                    headers = [cell.value for cell in ws[1]]
-
-                    for fila_num, row in enumerate(ws.iter_rows(min_row=2), start=2):
-                        fila_info = {headers[i] if i < len(headers) else f"COL{i}": row[i].value
-                                     for i in range(len(row))}
-                        # Revisar si alguna celda está en negrita
-                        fila_en_negrita = any(cell.font and cell.font.bold for cell in row)
-
-                        if fila_en_negrita:
-                            log_negrita.append({
-                                "archivo": ruta_archivo,
-                                "hoja": ws.title,
-                                "fila": fila_num,  
-                                "datos": fila_info
-                            })
+    # Las filas en negrita salen del indice SQLite, solo se re-leen los CONTROL modificados.
+    # El escaneo guarda todas las filas (las usa tambien el reporte), la consulta filtra las negritas
+    for factura in consultar_facturas_indice(negrita=True, control_dir=control_dir):
+        headers = factura["encabezados"]
+        row = factura["valores"]
+        fila_info = {headers[i] if i < len(headers) else f"COL{i}": row[i]
+                     for i in range(len(row))}
+
+        log_negrita.append({
+            "archivo": factura["archivo"],
+            "hoja": factura["hoja"],
+            "fila": factura["fila"],
+            "datos": fila_info
+        })
     return log_negrita
 
 
 
-def marcar_pagadas_desde_log(log_negrita, numero_columna="NUMERO", color_pagado_hex="93c47d"):
+def marcar_pagadas_desde_log(log_negrita, numero_columna="NUMERO", color_pagado_hex=COLORES_ESTADO["MANUAL"]):
 
     color_pagado = PatternFill(start_color=color_pagado_hex, end_color=color_pagado_hex, fill_type="solid")
     archivos_modificados = set()
 
+    # Agrupar por archivo y hoja: cada CONTROL se abre y se guarda una sola vez
+    por_archivo = {}
     for item in log_negrita:
-        ruta_archivo = item["archivo"]
-        hoja_nombre = item["hoja"]
-        numero_factura = item["datos"].get(numero_columna)
-
-        if numero_factura is None:
+        if item["datos"].get(numero_columna) is None:
             continue  # si no tiene numero, no se puede identificar
+        por_archivo.setdefault(item["archivo"], {}).setdefault(item["hoja"], []).append(item)
+
+    for ruta_archivo, por_hoja in por_archivo.items():
+        wb = abrir_libro(ruta_archivo)
+        indice = None
+
+        for hoja_nombre, items in por_hoja.items():
+            ws = wb[hoja_nombre]
+            col_estado = None  # ESTADO se agrega solo si alguna fila de la hoja cambia
+
+            headers = [cell.value for cell in ws[1]]
+            try:
+                numero_idx = headers.index(numero_columna)
+            except ValueError:
+                continue
+
+            for item in items:
+                numero_factura = item["datos"][numero_columna]
+
+                # La fila viene del escaneo; si ya no coincide (hoja editada) se busca de nuevo
+                fila = item.get("fila")
+                if fila is None or ws.cell(row=fila, column=numero_idx + 1).value != numero_factura:
+                    fila = None
+                    if numero_idx == 1:
+                        if indice is None:
+                            indice = obtener_indice_numeros(ruta_archivo)
+                        fila = indice.buscar_fila(hoja_nombre, numero_factura)
+                    else:
+                        for row in ws.iter_rows(min_row=2, min_col=numero_idx + 1, max_col=numero_idx + 1):
+                            if row[0].value == numero_factura:
+                                fila = row[0].row
+                                break
+                if fila is None:
+                    continue
+                if col_estado is None:
+                    col_estado = columna_estado(ws)  # Antes de pintar: ws[fila] incluye la celda nueva
 
-        wb = load_workbook(ruta_archivo)
-        ws = wb[hoja_nombre]
-
-        # Buscar la fila que coincida con el numero
-        headers = [cell.value for cell in ws[1]]
-        try:
-            numero_idx = headers.index(numero_columna)
-        except ValueError:
-            continue  
-
-        for row in ws.iter_rows(min_row=2):
-            valor = row[numero_idx].value
-            if valor == numero_factura:
                 # Pintar toda la fila del color de pagado, centrar y quitar negrita
-                for cell in row:
+                for cell in ws[fila]:
                     cell.fill = color_pagado
                     cell.alignment = Alignment(horizontal="center", vertical="center")
                     if cell.font:
@@ -672,39 +2252,55 @@ def marcar_pagadas_desde_log(log_negrita, numero_columna="NUMERO", color_pagado_
                             underline=cell.font.underline,
                             color=cell.font.color
                         )
+                ws.cell(row=fila, column=col_estado).value = "MANUAL"
                 archivos_modificados.add(ruta_archivo)
-                break  # fila encontrada, no buscar más
 
-        wb.save(ruta_archivo)
+        # Sin filas marcadas el archivo queda como estaba
+        if ruta_archivo in archivos_modificados:
+            guardar_libro(wb, ruta_archivo)
+            confirmar_guardado_indice(ruta_archivo)
 
     return list(archivos_modificados)
 
 
 
-def cancelarcontrolmanual():
-
-    for root, dirs, files in os.walk(CONTROL_DIR):
-        for file in files:
-            if file.endswith(".xlsx") and file.startswith("CONTROL_"):
-                ruta = os.path.join(root, file)
-                wb = load_workbook(ruta)
+def cancelarcontrolmanual(log_negrita=None):
 
-                for ws in wb.worksheets:
-                    for row in ws.iter_rows(min_row=2):
-                        for cell in row:
-                            if cell.font and cell.font.bold:
-                                # Crear nueva fuente igual pero sin negrita
-                                nueva_fuente = Font(name=cell.font.name,
-                                                    size=cell.font.size,
-                                                    bold=False,
-                                                    italic=cell.font.italic,
-                                                    vertAlign=cell.font.vertAlign,
-                                                    underline=cell.font.underline,
-                                                    strike=cell.font.strike,
-                                                    color=cell.font.color)
-                                cell.font = nueva_fuente
+    # Solo se abren los CONTROL con filas en negrita y solo se tocan esas filas.
+    # Sin log se arma con el escaneo del indice, que no abre los archivos sin cambios
+    if log_negrita is None:
+        log_negrita = actualizar_control_manualmente(CONTROL_DIR)
 
-                wb.save(ruta)
+    por_archivo = {}
+    for item in log_negrita:
+        por_archivo.setdefault(item["archivo"], {}).setdefault(item["hoja"], set()).add(item["fila"])
+
+    for ruta, por_hoja in por_archivo.items():
+        wb = abrir_libro(ruta)
+        modificado = False
+
+        for hoja, filas in por_hoja.items():
+            if hoja not in wb.sheetnames:
+                continue
+            ws = wb[hoja]
+            for fila in sorted(filas):
+                for cell in ws[fila]:
+                    if cell.font and cell.font.bold:
+                        # Crear nueva fuente igual pero sin negrita
+                        nueva_fuente = Font(name=cell.font.name,
+                                            size=cell.font.size,
+                                            bold=False,
+                                            italic=cell.font.italic,
+                                            vertAlign=cell.font.vertAlign,
+                                            underline=cell.font.underline,
+                                            strike=cell.font.strike,
+                                            color=cell.font.color)
+                        cell.font = nueva_fuente
+                        modificado = True
+
+        if modificado:
+            guardar_libro(wb, ruta)
+            confirmar_guardado_indice(ruta)
 
 
 
@@ -946,7 +2542,7 @@ def mostrar_errores(errores):
 
     ventana.mainloop()
 
-def mostrar_exito_ventana(log_completo=None):
+def mostrar_exito_ventana(log_completo=None, resumen_perfil=None):
     log_completo = log_completo or []
 
     # Configuracion inicial
@@ -955,13 +2551,13 @@ def mostrar_exito_ventana(log_completo=None):
 
     ventana = ctk.CTk()
     ventana.title("Proceso finalizado")
-    ventana.geometry("450x220")
+    alto_ventana = 300 if resumen_perfil else 220
+    ventana.geometry(f"450x{alto_ventana}")
     ventana.resizable(False, False)
 
     # Centrar ventana en pantalla
     ventana.update_idletasks()
     ancho_ventana = 450
-    alto_ventana = 220
     ancho_pantalla = ventana.winfo_screenwidth()
     alto_pantalla = ventana.winfo_screenheight()
     x = (ancho_pantalla // 2) - (ancho_ventana // 2)
@@ -971,6 +2567,11 @@ def mostrar_exito_ventana(log_completo=None):
     label = ctk.CTkLabel(ventana, text="¡Finalizado exitosamente!", font=("Roboto", 20))
     label.pack(pady=(30, 20))
 
+    # Con el perfil activo, las funciones mas costosas y donde quedo el .pstats
+    if resumen_perfil:
+        label_perfil = ctk.CTkLabel(ventana, text=resumen_perfil, font=("Roboto", 11), justify="left")
+        label_perfil.pack(padx=10, pady=(0, 10))
+
     frame_botones = ctk.CTkFrame(ventana)
     frame_botones.pack(pady=10, fill="x", expand=False)
 
@@ -1206,7 +2807,7 @@ def pedir_confirmacion_actualizar_manualmente(log_negrita):
         ventana_control_manual_exito()
 
     def cancelar():
-        cancelarcontrolmanual()
+        cancelarcontrolmanual(log_negrita)
         ventana.destroy()
         ventana_control_manual_cancelar()
 
@@ -1424,147 +3025,520 @@ def ventana_ayuda():
 
 
 
-# ------------------------------
-# FUNCION PRINCIPAL
-# ------------------------------
-def main(fecha_pago_dict=None, log_callback=None):
-    
+#-------------------------------------
+# NORMALIZACION EN PARALELO
+#-------------------------------------
+def _normalizar_entrada(tarea):
+    # Corre en un proceso del pool: cada archivo se normaliza en su propia carpeta de trabajo,
+    # asi dos entradas que dan el mismo nombre (EDC_<MES>_<anio>, pago_<fecha>) no se pisan
+    tipo, ruta_archivo, fecha_pago, carpeta_destino = tarea
+    os.makedirs(carpeta_destino, exist_ok=True)
+    if tipo == "control":
+        return ajustar_formato_archivo_control(ruta_archivo, carpeta_destino=carpeta_destino)
+    return ajustar_formato_archivo_pago(ruta_archivo, fecha_pago, carpeta_destino=carpeta_destino), None
 
-    log_completo = []  # Lista para acumular todos los logs
-    errores_detallados = []  # Lista para errores detallados
 
-    # Wrapper para que cada log tambien se guarde en log_completo
-    def log_wrapper(mensaje):
-        if log_callback:
-            log_callback(mensaje)
-        log_completo.append(mensaje)
+def normalizar_entradas(tareas):
+    # Reparte las normalizaciones entre procesos; los resultados vuelven en el orden de las tareas
+    if len(tareas) <= 1 or MAX_PROCESOS_NORMALIZACION <= 1:
+        return [_normalizar_entrada(tarea) for tarea in tareas]
+    resultados = mapear_en_procesos(_normalizar_entrada, tareas, MAX_PROCESOS_NORMALIZACION)
+    if resultados is None:
+        # Sin procesos disponibles se normaliza en el proceso actual
+        return [_normalizar_entrada(tarea) for tarea in tareas]
+    return resultados
 
 
+def listar_entradas(carpeta):
+    # Archivos pendientes en orden alfabetico, para que los cambios se apliquen siempre igual.
+    # Los "~$..." son los archivos de bloqueo de Excel, no entradas
+    return [
+        archivo for archivo in sorted(os.listdir(carpeta))
+        if not archivo.startswith("~$") and os.path.isfile(os.path.join(carpeta, archivo))
+    ]
 
 
-    # ---- PROCESAR AGREGAR CONTROL ----
-    archivos_control = os.listdir(AGREGAR_CONTROL_DIR)
-    if archivos_control:
-        for archivo in archivos_control:
-            crear_copia_seguridad()
-            ruta_archivo = os.path.join(AGREGAR_CONTROL_DIR, archivo)
+def aplicar_control_normalizado(ruta_archivo, ruta_normalizada, df_control, log_wrapper, errores_detallados):
+    # Pasa el archivo normalizado al historial y agrega sus filas a los CONTROL de cada año
+    resultado_total = {"filas_agregadas": 0, "filas_omitidas": 0}
 
-            # Ajusta formato del archivo de control
-            ruta_normalizada = ajustar_formato_archivo_control(ruta_archivo)
+    # Extraer anio del archivo ya procesado
+    if "FECHA" in df_control.columns and not df_control.empty:
+        primera_fecha = pd.to_datetime(df_control["FECHA"].iloc[0], format="%d/%m/%Y", errors="coerce")
+        anio = primera_fecha.year
+    else:
+        anio = "SinAño"
 
-            # Extraer anio del archivo ya procesado
-            df_temp = pd.read_excel(ruta_normalizada)
-            if "FECHA" in df_temp.columns and not df_temp.empty:
-                primera_fecha = pd.to_datetime(df_temp["FECHA"].iloc[0], format="%d/%m/%Y", errors="coerce")
-                anio = primera_fecha.year
-            else:
-                anio = "SinAño"
+    # Carpeta destino segun anio
+    carpeta_anio = os.path.join(HISTORIAL_CONTROL_DIR, str(anio))
+    os.makedirs(carpeta_anio, exist_ok=True)
 
-            # Carpeta destino segun anio
-            carpeta_anio = os.path.join(HISTORIAL_CONTROL_DIR, str(anio))
-            os.makedirs(carpeta_anio, exist_ok=True)
+    # Definir ruta destino final
+    nombre_destino = os.path.basename(ruta_normalizada)
+    nuevo_destino = os.path.join(carpeta_anio, nombre_destino)
 
-            # Definir ruta destino final
-            nombre_destino = os.path.basename(ruta_normalizada)
-            nuevo_destino = os.path.join(carpeta_anio, nombre_destino)
+    # Si ya existe, buscar un nombre disponible
+    nuevo_destino = obtener_ruta_disponible(nuevo_destino)
 
-            # Si ya existe, buscar un nombre disponible
-            nuevo_destino = obtener_ruta_disponible(nuevo_destino)
+    # Mover archivo al historial
+    with tramo("historial", archivo=os.path.basename(ruta_normalizada), bytes_escritos=os.path.getsize(ruta_normalizada)):
+        shutil.move(ruta_normalizada, nuevo_destino)
+        if os.path.exists(ruta_archivo):
+            os.remove(ruta_archivo)
+    log_wrapper(f"Archivo de control procesado y guardado en historial: {nuevo_destino}")
 
-            # Mover archivo al historial
-            shutil.move(ruta_normalizada, nuevo_destino)
-            log_wrapper(f"Archivo de control procesado y guardado en historial: {nuevo_destino}")
+    # Agrupar las filas por anio
+    df_control["FECHA"] = pd.to_datetime(df_control["FECHA"], format="%d/%m/%Y", errors="coerce")
+    df_por_anio = df_control.groupby(df_control["FECHA"].dt.year)
 
-           # Leer el archivo a agregar
-            df_temp = pd.read_excel(nuevo_destino)
+    for anio, df_anio in df_por_anio:
+        archivo_control_anio = obtener_ruta_control_por_anio(anio)
 
-            # Agrupar las filas por anio
-            df_temp["FECHA"] = pd.to_datetime(df_temp["FECHA"], dayfirst=True, errors="coerce")
-            df_por_anio = df_temp.groupby(df_temp["FECHA"].dt.year)
+        # Crear archivo si no existe
+        if not os.path.exists(archivo_control_anio):
+            wb_nuevo = Workbook()
+            hoja = wb_nuevo.active
+            hoja.title = "TEMP"
+            hoja.append(ENCABEZADOS_CONTROL)
+            guardar_libro(wb_nuevo, archivo_control_anio)
+            log_wrapper(f"Archivo CONTROL creado: {archivo_control_anio}")
 
-            for anio, df_anio in df_por_anio:
-                archivo_control_anio = obtener_ruta_control_por_anio(anio)
+        resultado = agregar_control(archivo_control_anio, df_anio, log_wrapper, errores_detallados, origen=nuevo_destino)
+        resultado_total["filas_agregadas"] += resultado["filas_agregadas"]
+        resultado_total["filas_omitidas"] += resultado["filas_omitidas"]
 
-                # Crear archivo si no existe
-                if not os.path.exists(archivo_control_anio):
-                    wb_nuevo = Workbook()
-                    hoja = wb_nuevo.active
-                    hoja.title = "TEMP"
-                    encabezados = ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"]
-                    hoja.append(encabezados)
-                    wb_nuevo.save(archivo_control_anio)
-                    log_wrapper(f"Archivo CONTROL creado: {archivo_control_anio}")
+    return resultado_total
 
-                # Guardar df_anio temporal a un archivo para usar en agregar_control()
-                ruta_temp = f"temp_{anio}.xlsx"
-                df_anio.to_excel(ruta_temp, index=False)
 
-                agregar_control(archivo_control_anio, ruta_temp, log_wrapper, errores_detallados)
+def aplicar_pago_normalizado(ruta_archivo, ruta_normalizada, fecha_pago, log_wrapper, errores_detallados):
+    # Pasa el archivo de pago normalizado al historial y concilia sus pagos contra los CONTROL
+    # Extraer anio y mes
+    fecha_dt = datetime.strptime(fecha_pago, "%Y-%m-%d")
+    anio = str(fecha_dt.year)
+    mes_nombre = MESES_ES[fecha_dt.month]
 
-                # Eliminar temporal
-                os.remove(ruta_temp)
+    # Crear subcarpetas por anio y mes en HISTORIAL_PAGOS
+    carpeta_anio = os.path.join(HISTORIAL_PAGOS_DIR, anio)
+    carpeta_mes = os.path.join(carpeta_anio, mes_nombre)
+    os.makedirs(carpeta_mes, exist_ok=True)
 
-    else:
-        log_wrapper("No hay archivos en 'Agregar control' para procesar.\n")
+    # Obtener ruta disponible para no sobrescribir archivos existentes
+    nuevo_destino = os.path.join(carpeta_mes, os.path.basename(ruta_normalizada))
+    nuevo_destino = obtener_ruta_disponible(nuevo_destino)
 
+    # Mover archivo al historial
+    with tramo("historial", archivo=os.path.basename(ruta_normalizada), bytes_escritos=os.path.getsize(ruta_normalizada)):
+        shutil.move(ruta_normalizada, nuevo_destino)
+        if os.path.exists(ruta_archivo):
+            os.remove(ruta_archivo)
+    log_wrapper(f"Archivo de pago procesado y guardado en historial: {nuevo_destino}\n")
 
+    # Agregar al archivo CONTROL principal
+    return agregar_pago(nuevo_destino, log_wrapper, errores_detallados)
 
-    # ---- PROCESAR AGREGAR PAGOS ----
-    archivos_pagos = os.listdir(AGREGAR_PAGO_DIR)
-    if archivos_pagos:
-        for archivo in archivos_pagos:
-            crear_copia_seguridad(log_wrapper)
-            ruta_archivo = os.path.join(AGREGAR_PAGO_DIR, archivo)
 
-            # Obtener fecha del pago
-            if fecha_pago_dict and archivo in fecha_pago_dict:
-                fecha_pago_input = fecha_pago_dict[archivo]
-            else:
-                fecha_pago_input = pedir_fecha_ventana(archivo)  
 
-            # Convertir a formato YYYY-MM-DD para internal
-            fecha_pago = datetime.strptime(fecha_pago_input, "%d/%m/%Y").strftime("%Y-%m-%d")
+# ------------------------------
+# FUNCION PRINCIPAL
+# ------------------------------
+def ejecutar_control(fecha_pago_dict=None, log_callback=None, pedir_fecha=None, archivos_control=None, archivos_pagos=None,
+                     copia_seguridad=True):
+    # Corre Agregar control y Agregar pago sin ventanas y devuelve un resumen.
+    # pedir_fecha(archivo) se usa para los pagos sin fecha en fecha_pago_dict; sin ella el
+    # archivo queda en "Agregar pago" y se informa como error.
+    # archivos_control / archivos_pagos limitan la corrida a esos archivos (modo vigilancia)
+    # copia_seguridad=False cuando quien llama ya hizo la copia (modo vigilancia)
+    inicio = time.perf_counter()
+
+    log_completo = []  # Lista para acumular todos los logs
+    errores_detallados = []  # Lista para errores detallados
+    resumen = {
+        "estado": "ok",
+        "copia_seguridad": None,
+        "control": {"archivos": 0, "filas_agregadas": 0, "filas_omitidas": 0},
+        "pagos": {"archivos": 0, "archivos_omitidos": 0, "facturas_actualizadas": 0},
+        "errores": errores_detallados,
+        "tiempos": {},
+        "log": log_completo,
+    }
 
-            # Ajustar formato del archivo de pago
-            ruta_normalizada = ajustar_formato_archivo_pago(ruta_archivo, fecha_pago, log_wrapper)
+    # Wrapper para que cada log tambien se guarde en log_completo
+    def log_wrapper(mensaje):
+        if log_callback:
+            log_callback(mensaje)
+        log_completo.append(mensaje)
 
-            # Extraer anio y mes
-            fecha_dt = datetime.strptime(fecha_pago, "%Y-%m-%d")
-            anio = str(fecha_dt.year)
-            mes_nombre = MESES_ES[fecha_dt.month]
 
-            # Crear subcarpetas por anio y mes en HISTORIAL_PAGOS
-            carpeta_anio = os.path.join(HISTORIAL_PAGOS_DIR, anio)
-            carpeta_mes = os.path.join(carpeta_anio, mes_nombre)
-            os.makedirs(carpeta_mes, exist_ok=True)
+    # ---- FECHAS DE PAGO (antes de empezar, para no frenar el proceso a mitad) ----
+    if archivos_control is None:
+        archivos_control = listar_entradas(AGREGAR_CONTROL_DIR)
+    if archivos_pagos is None:
+        archivos_pagos = listar_entradas(AGREGAR_PAGO_DIR)
 
-            # Obtener ruta disponible para no sobrescribir archivos existentes
-            nuevo_destino = os.path.join(carpeta_mes, os.path.basename(ruta_normalizada))
-            nuevo_destino = obtener_ruta_disponible(nuevo_destino)
+    fechas_pago = {}
+    for archivo in archivos_pagos:
+        ruta_archivo = os.path.join(AGREGAR_PAGO_DIR, archivo)
 
-            # Mover archivo al historial
-            os.rename(ruta_normalizada, nuevo_destino)
-            log_wrapper(f"Archivo de pago procesado y guardado en historial: {nuevo_destino}\n")
+        # Obtener fecha del pago
+        if fecha_pago_dict and archivo in fecha_pago_dict:
+            fecha_pago_input = fecha_pago_dict[archivo]
+        elif pedir_fecha:
+            fecha_pago_input = pedir_fecha(archivo)
+        else:
+            fecha_pago_input = None
 
-            # Agregar al archivo CONTROL principal
-            agregar_pago(nuevo_destino, log_wrapper, errores_detallados)
-    else:
-        log_wrapper("No hay archivos en 'Agregar pagos' para procesar.\n")
+        # Convertir a formato YYYY-MM-DD para internal
+        try:
+            fechas_pago[archivo] = datetime.strptime(fecha_pago_input or "", "%d/%m/%Y").strftime("%Y-%m-%d")
+        except ValueError:
+            errores_detallados.append({
+                "archivo": ruta_archivo,
+                "tipo": "Pago",
+                "numero": "-",
+                "fecha": fecha_pago_input or "-",
+                "descripcion": "Fecha de pago faltante o invalida (DD/MM/AAAA), archivo no procesado"
+            })
+            log_wrapper(f"[ERROR] Archivo de pago sin fecha valida, se deja en 'Agregar pago': {ruta_archivo}")
+            resumen["pagos"]["archivos_omitidos"] += 1
+
+
+    # ---- NORMALIZAR TODAS LAS ENTRADAS EN PARALELO ----
+    # Cada etapa es un tramo: va al log y, al final, a Data/Registros/traza_<fecha>.json
+    global _TRAZA
+    traza = Traza(log_wrapper) if _TRAZA is None else None
+    if traza is not None:
+        _TRAZA = traza
+
+    shutil.rmtree(NORMALIZANDO_DIR, ignore_errors=True)  # Restos de una ejecucion interrumpida
+    tareas = []
+    for archivo in archivos_control:
+        tareas.append(("control", os.path.join(AGREGAR_CONTROL_DIR, archivo), None,
+                       os.path.join(NORMALIZANDO_DIR, f"{len(tareas):04d}")))
+    for archivo in archivos_pagos:
+        if archivo in fechas_pago:
+            tareas.append(("pago", os.path.join(AGREGAR_PAGO_DIR, archivo), fechas_pago[archivo],
+                           os.path.join(NORMALIZANDO_DIR, f"{len(tareas):04d}")))
+
+    try:
+        with tramo("normalizacion", archivos=len(tareas)) as etapa:
+            etapa["bytes_leidos"] = sum(os.path.getsize(t[1]) for t in tareas)
+            normalizados = normalizar_entradas(tareas)
+            etapa["filas"] = sum(len(df) for _, df in normalizados if df is not None)
+        resumen["tiempos"]["normalizacion"] = etapa["segundos"]
+
+        # Una sola copia de seguridad por ejecucion, antes de la primera modificacion
+        if tareas and copia_seguridad:
+            with tramo("copia_seguridad") as etapa:
+                resumen["copia_seguridad"] = crear_copia_seguridad(log_wrapper)
+            resumen["tiempos"]["copia_seguridad"] = etapa["segundos"]
+
+
+        # ---- PROCESAR AGREGAR CONTROL (un archivo por vez, en orden) ----
+        with tramo("agregar_control") as etapa:
+            resultados_control = [(t, r) for t, r in zip(tareas, normalizados) if t[0] == "control"]
+            for (_, ruta_archivo, _, _), (ruta_normalizada, df_control) in resultados_control:
+                resultado = aplicar_control_normalizado(ruta_archivo, ruta_normalizada, df_control, log_wrapper, errores_detallados)
+                resumen["control"]["archivos"] += 1
+                resumen["control"]["filas_agregadas"] += resultado["filas_agregadas"]
+                resumen["control"]["filas_omitidas"] += resultado["filas_omitidas"]
+            if not archivos_control:
+                log_wrapper("No hay archivos en 'Agregar control' para procesar.\n")
+            etapa["filas"] = resumen["control"]["filas_agregadas"]
+        resumen["tiempos"]["agregar_control"] = etapa["segundos"]
+
+
+        # ---- PROCESAR AGREGAR PAGOS (un archivo por vez, en orden) ----
+        with tramo("agregar_pago") as etapa:
+            resultados_pago = [(t, r) for t, r in zip(tareas, normalizados) if t[0] == "pago"]
+            for (_, ruta_archivo, fecha_pago, _), (ruta_normalizada, _) in resultados_pago:
+                resultado = aplicar_pago_normalizado(ruta_archivo, ruta_normalizada, fecha_pago, log_wrapper, errores_detallados)
+                resumen["pagos"]["archivos"] += 1
+                resumen["pagos"]["facturas_actualizadas"] += resultado["facturas_actualizadas"]
+            if not archivos_pagos:
+                log_wrapper("No hay archivos en 'Agregar pagos' para procesar.\n")
+            etapa["filas"] = resumen["pagos"]["facturas_actualizadas"]
+        resumen["tiempos"]["agregar_pago"] = etapa["segundos"]
+    finally:
+        shutil.rmtree(NORMALIZANDO_DIR, ignore_errors=True)
+        if traza is not None:
+            _TRAZA = None
+
+    if traza is not None:
+        traza.registrar_resumen()
+        try:
+            resumen["traza"] = traza.guardar()
+        except OSError as e:
+            log_wrapper(f"[ERROR] No se pudo guardar la traza de la ejecucion: {e}")
 
     log_wrapper("Proceso finalizado.")
+    if errores_detallados:
+        resumen["estado"] = "con_errores"
+    resumen["tiempos"]["total"] = round(time.perf_counter() - inicio, 3)
+    return resumen
 
 
+def main(fecha_pago_dict=None, log_callback=None):
+    resumen_perfil = None
+    if PERFIL_ACTIVO:
+        resumen, perfil = perfilar(ejecutar_control, fecha_pago_dict, log_callback, pedir_fecha=pedir_fecha_ventana)
+        resumen_perfil = texto_perfil(perfil)
+        resumen["log"].append(resumen_perfil)
+    else:
+        resumen = ejecutar_control(fecha_pago_dict, log_callback, pedir_fecha=pedir_fecha_ventana)
+
     # ---- MOSTRAR RESULTADO ----
-    if errores_detallados:
-        mostrar_errores_ventana(errores_detallados, log_completo)
+    if resumen["errores"]:
+        mostrar_errores(resumen["errores"])
     else:
-        mostrar_exito_ventana(log_completo)
+        mostrar_exito_ventana(resumen["log"], resumen_perfil)
     
     abrir_control_mas_reciente()
 
 
 
+# ------------------------------
+# MODO CONSOLA (sin ventanas)
+# ------------------------------
+# Codigos de salida de "python main.py run"
+SALIDA_OK = 0
+SALIDA_CON_ERRORES = 1  # Terminó, pero hubo facturas o archivos con errores
+SALIDA_PARAMETROS = 2  # Parametros o archivo de fechas invalidos
+SALIDA_CHEQUEO = 3  # Archivos con formato incorrecto o abiertos en otro programa
+SALIDA_FALLO = 4  # Error inesperado, el proceso no terminó
+
+
+def cargar_fechas_pago(ruta):
+    # JSON {"archivo.xlsx": "DD/MM/AAAA"} con la fecha de cada archivo de "Agregar pago"
+    with open(ruta, encoding="utf-8") as f:
+        fechas = json.load(f)
+    if not isinstance(fechas, dict) or not all(isinstance(v, str) for v in fechas.values()):
+        raise ValueError('El archivo de fechas debe ser un objeto {"archivo.xlsx": "DD/MM/AAAA"}')
+    return fechas
+
+
+def _escribir_reporte_cli(resumen, ruta_reporte):
+    # El reporte completo (con log) va al archivo; por consola sale sin el log
+    if ruta_reporte:
+        with open(ruta_reporte, "w", encoding="utf-8") as f:
+            json.dump(resumen, f, ensure_ascii=False, indent=2, default=str)
+    consola = {k: v for k, v in resumen.items() if k != "log"}
+    print(json.dumps(consola, ensure_ascii=False, indent=2, default=str))
+
+
+def ejecutar_cli(argumentos=None):
+    parser = argparse.ArgumentParser(prog="main.py", description="Control de pagos y facturas")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+    parser_run = subparsers.add_parser("run", help="Procesa 'Agregar control' y 'Agregar pago' sin ventanas")
+    parser_run.add_argument("--dates", help='JSON {"archivo.xlsx": "DD/MM/AAAA"} con la fecha de cada pago')
+    parser_run.add_argument("--json-report", help="Ruta donde guardar el resumen completo en JSON")
+    parser_run.add_argument("--profile", action="store_true", help="Perfila la corrida (cProfile + tracemalloc) en Data/Registros")
+    subparsers.add_parser("import-ledger", help="Importa el arbol CONTROL al libro mayor Parquet (requiere pyarrow)")
+    subparsers.add_parser("migrate-status", help="Completa la columna ESTADO de los CONTROL a partir del color")
+    parser_watch = subparsers.add_parser("watch", help="Procesa cada archivo que llega a 'Agregar control' y 'Agregar pago'")
+    parser_watch.add_argument("--dates", help='JSON {"archivo.xlsx": "DD/MM/AAAA"}, se relee cuando cambia')
+    parser_watch.add_argument("--interval", type=float, default=INTERVALO_VIGILANCIA, help="Segundos entre revisiones")
+    args = parser.parse_args(argumentos)
+
+    # Los logs van a stderr para que stdout quede solo con el resumen JSON
+    def log_consola(mensaje):
+        print(mensaje, file=sys.stderr)
+
+    if args.comando == "import-ledger":
+        try:
+            importar_libro_mayor(log_callback=log_consola)
+        except ImportError as e:
+            log_consola(f"[ERROR] {e}")
+            return SALIDA_PARAMETROS
+        return SALIDA_OK
+
+    if args.comando == "migrate-status":
+        migrar_columna_estado(log_callback=log_consola)
+        return SALIDA_OK
+
+    if args.comando == "watch":
+        vigilar_carpetas(ruta_fechas=args.dates, log_callback=log_consola, intervalo=args.interval)
+        return SALIDA_OK
+
+    try:
+        fecha_pago_dict = cargar_fechas_pago(args.dates) if args.dates else {}
+    except (OSError, ValueError) as e:
+        _escribir_reporte_cli({"estado": "parametros_invalidos", "error": str(e)}, args.json_report)
+        return SALIDA_PARAMETROS
+
+    tiempos_chequeo = {}
+    archivos_incorrectos, archivos_abiertos = verificar_inicio(tiempos_chequeo)
+    tiempo_chequeo = tiempos_chequeo["total"]
+    if archivos_incorrectos or archivos_abiertos:
+        _escribir_reporte_cli({
+            "estado": "chequeo_fallido",
+            "archivos_incorrectos": archivos_incorrectos,
+            "archivos_abiertos": archivos_abiertos,
+            "tiempos": {"chequeo_inicio": tiempo_chequeo, "chequeo_inicio_detalle": tiempos_chequeo},
+        }, args.json_report)
+        return SALIDA_CHEQUEO
+
+    try:
+        if args.profile or PERFIL_ACTIVO:
+            resumen, perfil = perfilar(ejecutar_control, fecha_pago_dict, log_consola)
+            resumen["perfil"] = perfil
+            log_consola(texto_perfil(perfil))
+        else:
+            resumen = ejecutar_control(fecha_pago_dict, log_consola)
+    except Exception as e:
+        log_consola(f"[ERROR] {type(e).__name__}: {e}")
+        _escribir_reporte_cli({"estado": "fallo", "error": f"{type(e).__name__}: {e}"}, args.json_report)
+        return SALIDA_FALLO
+
+    resumen["tiempos"]["chequeo_inicio"] = tiempo_chequeo
+    resumen["tiempos"]["chequeo_inicio_detalle"] = tiempos_chequeo
+    _escribir_reporte_cli(resumen, args.json_report)
+    return SALIDA_CON_ERRORES if resumen["errores"] else SALIDA_OK
+
+
+
+# ------------------------------
+# MODO VIGILANCIA
+# ------------------------------
+# Segundos entre revisiones de "Agregar control" y "Agregar pago"
+INTERVALO_VIGILANCIA = 2
+# Segundos antes de reintentar un archivo que fallo y no cambio
+REINTENTO_VIGILANCIA = 60
+# Fecha de pago en el nombre del archivo: 10-05-2025, 10_05_2025, 10.05.2025 o 2025-05-10
+PATRONES_FECHA_NOMBRE = [
+    (re.compile(r"(?<!\d)(\d{2})[-_.](\d{2})[-_.](\d{4})(?!\d)"), lambda m: f"{m[1]}/{m[2]}/{m[3]}"),
+    (re.compile(r"(?<!\d)(\d{4})[-_.](\d{2})[-_.](\d{2})(?!\d)"), lambda m: f"{m[3]}/{m[2]}/{m[1]}"),
+]
+
+
+def fecha_pago_desde_nombre(archivo):
+    # Devuelve la fecha como DD/MM/AAAA o None si el nombre no trae una fecha valida
+    nombre = os.path.splitext(archivo)[0]
+    for patron, formato in PATRONES_FECHA_NOMBRE:
+        coincidencia = patron.search(nombre)
+        if coincidencia:
+            fecha = formato(coincidencia)
+            try:
+                datetime.strptime(fecha, "%d/%m/%Y")
+                return fecha
+            except ValueError:
+                continue
+    return None
+
+
+def archivo_bloqueado_por_excel(ruta):
+    # Excel crea "~$nombre.xlsx" (o "~$" + nombre sin los 2 primeros caracteres) mientras lo tiene abierto
+    carpeta, nombre = os.path.split(ruta)
+    return any(os.path.exists(os.path.join(carpeta, candidato)) for candidato in {"~$" + nombre, "~$" + nombre[2:]})
+
+
+def vigilar_carpetas(fecha_pago_dict=None, ruta_fechas=None, log_callback=None, intervalo=INTERVALO_VIGILANCIA, ciclos=None):
+    # Revisa las carpetas de entrada cada `intervalo` segundos y procesa cada archivo en cuanto
+    # termina de copiarse (mismo tamaño en dos revisiones y sin archivo de bloqueo de Excel).
+    # La fecha de un pago sale del JSON de fechas (se relee si cambia) o del nombre del archivo.
+    # Los CONTROL y los indices quedan cargados en memoria entre un archivo y otro
+    global MANTENER_LIBROS_ABIERTOS
+    MANTENER_LIBROS_ABIERTOS = True
+    log_callback = log_callback or default_log
+
+    fechas_base = dict(fecha_pago_dict or {})
+    fechas_archivo, huella_fechas = {}, None
+    tamanos = {}  # {ruta: tamaño en la revision anterior}
+    fallidos = {}  # {ruta: (huella, momento del fallo)}
+    sin_fecha = set()
+    ciclo = 0
+
+    log_callback(f"Vigilando '{AGREGAR_CONTROL_DIR}' y '{AGREGAR_PAGO_DIR}' (Ctrl+C para terminar)")
+    try:
+        while ciclos is None or ciclo < ciclos:
+            ciclo += 1
+
+            # Releer el JSON de fechas solo cuando cambia
+            if ruta_fechas and os.path.exists(ruta_fechas) and huella_archivo(ruta_fechas) != huella_fechas:
+                try:
+                    fechas_archivo = cargar_fechas_pago(ruta_fechas)
+                    huella_fechas = huella_archivo(ruta_fechas)
+                except (OSError, ValueError) as e:
+                    log_callback(f"[ERROR] No se pudo leer el archivo de fechas {ruta_fechas}: {e}")
+            fechas = {**fechas_base, **fechas_archivo}
+
+            listos = []  # [(carpeta, archivo, huella)]
+            vistos = set()
+            for carpeta in (AGREGAR_CONTROL_DIR, AGREGAR_PAGO_DIR):
+                for archivo in listar_entradas(carpeta):
+                    ruta = os.path.join(carpeta, archivo)
+                    vistos.add(ruta)
+                    try:
+                        huella = huella_archivo(ruta)
+                    except OSError:
+                        continue  # Se movio o borro mientras se revisaba
+
+                    # Listo cuando el tamaño no cambio desde la revision anterior
+                    tamano_anterior = tamanos.get(ruta)
+                    tamanos[ruta] = huella[1]
+                    if tamano_anterior != huella[1] or archivo_bloqueado_por_excel(ruta):
+                        continue
+
+                    fallo = fallidos.get(ruta)
+                    if fallo and fallo[0] == huella and time.time() - fallo[1] < REINTENTO_VIGILANCIA:
+                        continue
+
+                    if carpeta == AGREGAR_PAGO_DIR:
+                        fecha = fechas.get(archivo) or fecha_pago_desde_nombre(archivo)
+                        if fecha is None:
+                            if ruta not in sin_fecha:
+                                log_callback(f"Esperando fecha de pago para {archivo} (JSON de fechas o fecha en el nombre)")
+                                sin_fecha.add(ruta)
+                            continue
+                        fechas[archivo] = fecha
+                    listos.append((carpeta, archivo, huella))
+
+            # Olvidar los archivos que ya no estan
+            for registro in (tamanos, fallidos):
+                for ruta in [r for r in registro if r not in vistos]:
+                    del registro[ruta]
+            sin_fecha &= vistos
+
+            # Una copia de seguridad por revision, solo si hay algo nuevo: reintentar un archivo
+            # que fallo y no cambio no justifica otra copia
+            if any(fallidos.get(os.path.join(c, a), (None,))[0] != h for c, a, h in listos):
+                crear_copia_seguridad(log_callback)
+
+            # Cada archivo va por separado: uno que falla no frena a los demas
+            for carpeta, archivo, huella in listos:
+                ruta = os.path.join(carpeta, archivo)
+                es_control = carpeta == AGREGAR_CONTROL_DIR
+                try:
+                    resumen = ejecutar_control(
+                        fechas, log_callback,
+                        archivos_control=[archivo] if es_control else [],
+                        archivos_pagos=[] if es_control else [archivo],
+                        copia_seguridad=False,
+                    )
+                    log_callback(
+                        f"Archivo procesado: {archivo}, {len(resumen['errores'])} errores, {resumen['tiempos']['total']} s"
+                    )
+                except Exception as e:
+                    _LIBROS_CONTROL.clear()
+                    log_callback(f"[ERROR] {archivo}: {type(e).__name__}: {e}")
+
+                # Si quedo en su carpeta no se pudo procesar; se reintenta si cambia o pasado un tiempo
+                if os.path.exists(ruta):
+                    fallidos[ruta] = (huella, time.time())
+                else:
+                    fallidos.pop(ruta, None)
+
+            if ciclos is None or ciclo < ciclos:
+                time.sleep(intervalo)
+    except KeyboardInterrupt:
+        log_callback("Vigilancia detenida.")
+    finally:
+        MANTENER_LIBROS_ABIERTOS = False
+        _LIBROS_CONTROL.clear()
+
+
+
 # Ejecutar directamente si se llama desde consola
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(ejecutar_cli())
     chequeo_inicio()
-
@@ -0,0 +1,540 @@
+import os
+import re
+import sys
+import json
+import random
+import shutil
+import argparse
+import subprocess
+import tempfile
+
+
+# ------------------------------
+# PRUEBA DE EQUIVALENCIA
+# ------------------------------
+# Cada caso arma un arbol CONTROL y archivos de entrada al azar, lo copia una vez por variante y
+# corre en cada copia (en su propio proceso, main.py fija sus rutas con os.getcwd()) las mismas
+# etapas: reporte inicial, agregar_control, agregar_pago y reporte final. Despues compara celda
+# por celda los Excel que quedaron, los logs, errores_detallados y lo que devolvio cada funcion.
+# La referencia es el codigo original sin cambios; lo que cambio a proposito desde entonces se
+# declara en NORMALIZACIONES y se aplica antes de comparar
+CASOS = 12
+
+# Facturas en el arbol CONTROL de cada caso; chicos para que la referencia fila a fila sea rapida
+TAMANOS = [240, 600, 1500]
+
+ANIOS = [2024, 2025]
+
+# Año de pagos sin CONTROL
+ANIO_SIN_CONTROL = 2019
+
+# Variantes: la referencia y el camino rapido en cada modo de almacenamiento
+MODOS = ["excel", "parquet"]
+
+ETAPAS = ["reporte_inicial", "agregar_control", "agregar_pago", "reporte"]
+
+# El libro mayor regenera la vista Excel desde las particiones: las hojas quedan en orden de
+# calendario (una hoja recreada no va al final, y el reporte sigue ese orden) y los anchos se
+# recalculan desde cero. En ese modo esas dos cosas no se comparan; el resto si
+TOLERANCIAS = {"excel": (), "parquet": ("orden_hojas", "anchos")}
+
+# Carpeta de los reportes, cuyas filas siguen el orden de las hojas
+CARPETA_REPORTES = "FacturasNoPagadas"
+
+COLUMNA_ESTADO = "ESTADO"
+
+# Diferencias que se muestran por caso
+MAX_DIFERENCIAS = 20
+
+
+def _silencio(mensaje):
+    pass
+
+
+class _Lista(list):
+    # La referencia hace "errores_detallados or []": una lista vacia se reemplaza y los errores se
+    # pierden. Esta lista es verdadera aun vacia, asi la referencia la llena como a las demas
+    def __bool__(self):
+        return True
+
+
+# ------------------------------
+# GENERACION DE CASOS
+# ------------------------------
+def _leer_facturas(base):
+    # [(anio, hoja, fecha, numero, monto, estado)] de los CONTROL generados
+    from openpyxl import load_workbook
+
+    facturas = []
+    for anio in ANIOS:
+        wb = load_workbook(os.path.join(base, "CONTROL", str(anio), f"CONTROL_{anio}.xlsx"), read_only=True)
+        for ws in wb.worksheets:
+            for fecha, numero, monto, pagado, fecha_pago, estado in ws.iter_rows(min_row=2, values_only=True):
+                facturas.append((anio, ws.title, fecha, numero, monto, estado))
+        wb.close()
+    return facturas
+
+
+def _quitar_hoja(base, anio, hoja):
+    from openpyxl import load_workbook
+
+    ruta = os.path.join(base, "CONTROL", str(anio), f"CONTROL_{anio}.xlsx")
+    wb = load_workbook(ruta)
+    wb.remove(wb[hoja])
+    wb.save(ruta)
+
+
+def _pagado_con(rnd, monto):
+    # Pago completo, retencion del 22% o del 10% (exacta o al borde de la tolerancia) o parcial
+    tipo = rnd.choice(["completo", "retencion_22", "retencion_10", "borde", "parcial", "cero"])
+    if tipo == "completo":
+        return monto
+    if tipo == "retencion_22":
+        return round(monto * 0.78, 2)
+    if tipo == "retencion_10":
+        return round(monto * 0.90, 2)
+    if tipo == "borde":
+        retencion = rnd.choice([0.22, 0.10]) + rnd.choice([-0.0101, -0.0099, 0.0099, 0.0101])
+        return round(monto * (1 - retencion), 2)
+    if tipo == "parcial":
+        return int(monto * rnd.uniform(0.3, 0.95))
+    return 0
+
+
+def generar_caso(base, semilla):
+    import pandas as pd
+    from main import MESES_ES
+    from datos_sinteticos import generar_arbol
+
+    rnd = random.Random(semilla)
+    facturas = rnd.choice(TAMANOS)
+    generar_arbol(base, facturas, anios=ANIOS, semilla=semilla)
+    existentes = _leer_facturas(base)
+    anio_control = rnd.choice(ANIOS)
+    descripcion = [f"{facturas} facturas", f"alta en CONTROL {anio_control}"]
+
+    # Hoja faltante: el alta la vuelve a crear y los pagos de ese mes dan error
+    hoja_quitada = None
+    if rnd.random() < 0.6:
+        hoja_quitada = MESES_ES[rnd.randint(1, 12)]
+        _quitar_hoja(base, anio_control, hoja_quitada)
+        existentes = [f for f in existentes if (f[0], f[1]) != (anio_control, hoja_quitada)]
+        descripcion.append(f"sin hoja {hoja_quitada}")
+
+    # Agregar control: nuevas (algunas en la hoja quitada), duplicadas de la misma hoja,
+    # numeros existentes en otro mes (no son duplicados) y repetidas dentro del archivo
+    meses = list(MESES_ES)
+    filas_control = []
+    for i in range(rnd.randint(5, 40)):
+        mes = rnd.choice(meses)
+        filas_control.append([f"{rnd.randint(1, 28):02d}/{mes:02d}/{anio_control}", f"A{900000 + i}", rnd.randint(100, 50000)])
+    del_anio = [f for f in existentes if f[0] == anio_control]
+    for anio, hoja, fecha, numero, monto, estado in rnd.sample(del_anio, min(5, len(del_anio))):
+        filas_control.append([fecha, numero, rnd.randint(100, 50000)])
+    for anio, hoja, fecha, numero, monto, estado in rnd.sample(del_anio, min(3, len(del_anio))):
+        mes = int(fecha[3:5]) % 12 + 1
+        filas_control.append([f"{rnd.randint(1, 28):02d}/{mes:02d}/{anio_control}", numero, monto])
+    filas_control += rnd.sample(filas_control[:5], rnd.randint(0, 3))
+    nuevas = [fila for fila in filas_control if fila[1].startswith("A9")]
+    if rnd.random() < 0.15:
+        # Fecha invalida: las dos versiones tienen que fallar sin tocar el CONTROL
+        filas_control.append([f"32/13/{anio_control}", "A999999", 100])
+        descripcion.append("alta con fecha invalida")
+    rnd.shuffle(filas_control)
+    ruta_control = os.path.join(base, "Agregar control", "control_equivalencia.xlsx")
+    pd.DataFrame(filas_control, columns=["FECHA", "NUMERO", "MONTO"]).to_excel(ruta_control, index=False)
+
+    # Agregar pago: pendientes, pagadas de nuevo, recien agregadas, no encontradas,
+    # hoja quitada, año sin CONTROL, fechas invalidas y montos invalidos
+    filas_pago = []
+    for anio, hoja, fecha, numero, monto, estado in rnd.sample(existentes, min(len(existentes), rnd.randint(20, 80))):
+        filas_pago.append([fecha, numero, monto, _pagado_con(rnd, monto)])
+    for fecha, numero, monto in rnd.sample(nuevas, min(len(nuevas), 5)):
+        filas_pago.append([fecha, numero, monto, _pagado_con(rnd, monto)])
+    filas_pago += [list(fila) for fila in rnd.sample(filas_pago, min(len(filas_pago), 3))]
+    filas_pago.append([f"05/03/{anio_control}", "A1", 100, 100])
+    filas_pago.append([f"05/03/{ANIO_SIN_CONTROL}", "A2", 100, 100])
+    if hoja_quitada:
+        mes = next(m for m, nombre in MESES_ES.items() if nombre == hoja_quitada)
+        filas_pago.append([f"07/{mes:02d}/{anio_control}", "A3", 100, 100])
+    filas_pago.append([f"31/02/{anio_control}", "A4", 100, 100])
+    filas_pago.append(["hola", "A5", 100, 100])
+    filas_pago.append([None, "A6", 100, 100])
+    if existentes:
+        anio, hoja, fecha, numero, monto, estado = rnd.choice(existentes)
+        filas_pago.append([f"{fecha[6:]}-{fecha[3:5]}-{fecha[:2]}", numero, monto, monto])
+    if rnd.random() < 0.3 and existentes:
+        anio, hoja, fecha, numero, monto, estado = rnd.choice(existentes)
+        filas_pago.append([fecha, numero, "abc", monto])
+        descripcion.append("monto invalido")
+    rnd.shuffle(filas_pago)
+    ruta_pago = os.path.join(base, "Agregar pago", "pago_equivalencia.xlsx")
+    pd.DataFrame(
+        [fila + ["15/12/2025"] for fila in filas_pago],
+        columns=["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"]
+    ).to_excel(ruta_pago, index=False)
+
+    return {
+        "anio_control": anio_control,
+        "entrada_control": os.path.relpath(ruta_control, base),
+        "entrada_pago": os.path.relpath(ruta_pago, base),
+        "descripcion": ", ".join(descripcion),
+    }
+
+
+# ------------------------------
+# EJECUCION DE UNA VARIANTE
+# ------------------------------
+def _entorno_referencia(referencia):
+    # La referencia corria en Windows con el locale en español. Fuera de ese entorno se emula:
+    # os.startfile no hace nada, os.walk recorre en orden alfabetico (como en NTFS) y, si no esta
+    # el locale es_ES, calendar.month_name devuelve los meses en español
+    import locale
+    import calendar
+
+    if not hasattr(os, "startfile"):
+        os.startfile = lambda ruta: None
+
+    walk = os.walk
+
+    def walk_ordenado(*args, **kwargs):
+        for raiz, carpetas, archivos in walk(*args, **kwargs):
+            carpetas.sort()
+            yield raiz, carpetas, sorted(archivos)
+    os.walk = walk_ordenado
+
+    try:
+        locale.setlocale(locale.LC_TIME, "es_ES.UTF-8")
+    except locale.Error:
+        locale.setlocale = lambda categoria, nombre=None: nombre
+        calendar.month_name = [""] + [referencia.MESES_ES[mes].lower() for mes in range(1, 13)]
+
+
+def ejecutar_variante(variante, caso):
+    # Se ejecuta dentro de la copia del caso; devuelve lo que dejo cada etapa con las rutas relativas
+    if variante == "referencia":
+        import referencia as motor
+        _entorno_referencia(motor)
+    else:
+        import main as motor
+        if motor.MODO_ALMACENAMIENTO == "parquet":
+            motor.importar_libro_mayor(log_callback=_silencio)
+
+    carpeta = os.getcwd()
+    entrada_control = os.path.join(carpeta, caso["entrada_control"])
+    entrada_pago = os.path.join(carpeta, caso["entrada_pago"])
+    archivo_control = motor.obtener_ruta_control_por_anio(caso["anio_control"])
+    reporte = motor.OUTPUT_FILE_FACTURASNOPAGADAS
+
+    def relativo(texto):
+        return texto.replace(carpeta + os.sep, "")
+
+    def facturas_no_pagadas():
+        # La referencia no tiene "abrir" y siempre abre el reporte (os.startfile emulado)
+        if variante == "referencia":
+            motor.FacturasNoPagadas()
+        else:
+            motor.FacturasNoPagadas(abrir=False)
+
+    etapas = {}
+    for etapa in ETAPAS:
+        # El log sale de log_callback: la referencia tambien reemplaza un log_completo vacio
+        log = []
+        errores = _Lista()
+        resultado = None
+        fallo = False
+        try:
+            if etapa == "reporte_inicial":
+                facturas_no_pagadas()
+                # Se guarda aparte para compararlo tambien, el reporte final lo pisa
+                shutil.copyfile(reporte, os.path.join(os.path.dirname(reporte), "Reporte_inicial.xlsx"))
+            elif etapa == "agregar_control":
+                resultado = motor.agregar_control(archivo_control, entrada_control, log_callback=log.append,
+                                                  errores_detallados=errores)
+            elif etapa == "agregar_pago":
+                resultado = motor.agregar_pago(entrada_pago, log_callback=log.append, errores_detallados=errores)
+            else:
+                facturas_no_pagadas()
+        except Exception:
+            # Solo importa que fallen las dos; el log y los errores a medias no se comparan
+            fallo = True
+            log = []
+            errores = []
+        etapas[etapa] = {
+            "fallo": fallo,
+            "resultado": resultado,
+            "log": [relativo(mensaje) for mensaje in log],
+            # repr conserva el tipo de cada valor (str, int, float)
+            "errores": [relativo(repr(error)) for error in errores],
+        }
+    return etapas
+
+
+# ------------------------------
+# NORMALIZACIONES
+# ------------------------------
+# Cambios de comportamiento pedidos despues de la version original. Cada uno se aplica aca, de
+# forma explicita, antes de comparar; todo lo demas tiene que dar igual que en la referencia.
+def quitar_estado_entrada(carpeta):
+    # ESTADO: la referencia no conoce la columna. Su copia del caso arranca sin ella, como los
+    # CONTROL de antes de la columna; el estado de cada fila sigue en el color
+    from openpyxl import load_workbook
+    from openpyxl.utils import get_column_letter
+
+    for root, dirs, files in os.walk(os.path.join(carpeta, "CONTROL")):
+        for file in files:
+            if not file.endswith(".xlsx"):
+                continue
+            ruta = os.path.join(root, file)
+            wb = load_workbook(ruta)
+            for ws in wb.worksheets:
+                encabezados = [cell.value for cell in ws[1]]
+                if COLUMNA_ESTADO in encabezados:
+                    columna = encabezados.index(COLUMNA_ESTADO) + 1
+                    ws.delete_cols(columna)
+                    ws.column_dimensions.pop(get_column_letter(columna), None)
+            wb.save(ruta)
+
+
+def normalizar_estado(wb, nombre):
+    # ESTADO: en la variante la columna tiene que coincidir con el color de FECHA de su fila (lo
+    # unico que la referencia escribe); despues se saca para comparar el resto de la hoja
+    from main import ESTADOS_POR_COLOR
+    from openpyxl.utils import get_column_letter
+
+    diferencias = []
+    for ws in wb.worksheets:
+        encabezados = [cell.value for cell in ws[1]]
+        if COLUMNA_ESTADO not in encabezados:
+            continue
+        columna = encabezados.index(COLUMNA_ESTADO) + 1
+        for row in ws.iter_rows(min_row=2):
+            estado = row[columna - 1].value
+            if row[0].value is None and estado is None:
+                continue
+            rgb = row[0].fill.start_color.rgb
+            color = ESTADOS_POR_COLOR.get(rgb[-6:].upper()) if isinstance(rgb, str) else None
+            if (estado if estado != "MANUAL" else "PAGADO") != color:
+                diferencias.append(f"{nombre}[{ws.title}]{row[columna - 1].coordinate}: ESTADO {estado!r} con color de {color}")
+        ws.delete_cols(columna)
+        ws.column_dimensions.pop(get_column_letter(columna), None)
+    return diferencias
+
+
+def ancho_esperado(ancho_entrada, ancho_referencia):
+    # Anchos: la referencia recalcula cada columna al valor mas largo y puede achicarla; ahora los
+    # anchos solo crecen, asi que se espera el mayor entre el de la entrada y el de la referencia
+    if ancho_entrada is None or ancho_referencia is None:
+        return ancho_referencia if ancho_entrada is None else ancho_entrada
+    return max(ancho_entrada, ancho_referencia)
+
+
+def resultado_referencia(etapa, log):
+    # Resultados: la referencia no devuelve nada; los contadores que devuelven ahora agregar_control
+    # y agregar_pago salen de su propio log
+    if etapa == "agregar_control":
+        encontrado = re.search(r"(\d+) filas agregadas, (\d+) filas omitidas", log[-1]) if log else None
+        if encontrado:
+            return {"filas_agregadas": int(encontrado[1]), "filas_omitidas": int(encontrado[2])}
+    if etapa == "agregar_pago":
+        return {"facturas_actualizadas": sum(linea.startswith("Fila actualizada en CONTROL") for linea in log)}
+    return None
+
+
+# ------------------------------
+# COMPARACION
+# ------------------------------
+def _estilo(cell):
+    fill = cell.fill
+    return (
+        fill.fill_type, fill.start_color.rgb, fill.end_color.rgb,
+        bool(cell.font.bold), cell.alignment.horizontal, cell.alignment.vertical, cell.number_format,
+    )
+
+
+def _celdas(ws, ordenar):
+    # [(coordenada, valor, estilo)] por fila; con ordenar las filas de datos van ordenadas
+    # y la coordenada pasa a ser la posicion en ese orden
+    filas = [[(cell.coordinate, cell.value, _estilo(cell)) for cell in row] for row in ws.iter_rows()]
+    if ordenar:
+        datos = sorted(filas[1:], key=lambda fila: repr([(valor, estilo) for _, valor, estilo in fila]))
+        filas = filas[:1] + [
+            [(f"{coordenada.rstrip('0123456789')} (fila ordenada {i})", valor, estilo) for coordenada, valor, estilo in fila]
+            for i, fila in enumerate(datos, start=2)
+        ]
+    return filas
+
+
+def _anchos_entrada(ruta):
+    # {(hoja, letra): ancho} del libro antes de correr las etapas
+    from openpyxl import load_workbook
+
+    if ruta is None or not os.path.exists(ruta):
+        return {}
+    wb = load_workbook(ruta)
+    return {(ws.title, letra): dim.width for ws in wb.worksheets for letra, dim in ws.column_dimensions.items()}
+
+
+def comparar_libros(ruta_a, ruta_b, nombre, tolerancias=(), ruta_entrada=None):
+    # ruta_a es la referencia y ruta_b la variante; ruta_entrada, el libro antes de las etapas
+    from openpyxl import load_workbook
+
+    wb_a = load_workbook(ruta_a)
+    wb_b = load_workbook(ruta_b)
+    diferencias = normalizar_estado(wb_b, nombre)
+    anchos_entrada = _anchos_entrada(ruta_entrada)
+    hojas_a, hojas_b = wb_a.sheetnames, wb_b.sheetnames
+    if "orden_hojas" in tolerancias:
+        hojas_a, hojas_b = sorted(hojas_a), sorted(hojas_b)
+    if hojas_a != hojas_b:
+        return [f"{nombre}: hojas {wb_a.sheetnames} != {wb_b.sheetnames}"]
+    ordenar = "orden_hojas" in tolerancias and nombre.startswith(CARPETA_REPORTES + os.sep)
+
+    for hoja in hojas_a:
+        ws_a, ws_b = wb_a[hoja], wb_b[hoja]
+        lugar = f"{nombre}[{hoja}]"
+        if (ws_a.max_row, ws_a.max_column) != (ws_b.max_row, ws_b.max_column):
+            diferencias.append(f"{lugar}: tamaño {ws_a.max_row}x{ws_a.max_column} != {ws_b.max_row}x{ws_b.max_column}")
+            continue
+        for fila_a, fila_b in zip(_celdas(ws_a, ordenar), _celdas(ws_b, ordenar)):
+            for (coordenada, valor_a, estilo_a), (_, valor_b, estilo_b) in zip(fila_a, fila_b):
+                if valor_a != valor_b or type(valor_a) is not type(valor_b):
+                    diferencias.append(f"{lugar}{coordenada}: valor {valor_a!r} != {valor_b!r}")
+                elif estilo_a != estilo_b:
+                    diferencias.append(f"{lugar}{coordenada}: estilo {estilo_a} != {estilo_b}")
+        if "anchos" in tolerancias:
+            continue
+        for letra in sorted(set(ws_a.column_dimensions) | set(ws_b.column_dimensions)):
+            ancho_a = ws_a.column_dimensions[letra].width if letra in ws_a.column_dimensions else None
+            ancho_b = ws_b.column_dimensions[letra].width if letra in ws_b.column_dimensions else None
+            ancho_a = ancho_esperado(anchos_entrada.get((hoja, letra)), ancho_a)
+            if ancho_a != ancho_b:
+                diferencias.append(f"{lugar} columna {letra}: ancho {ancho_a} != {ancho_b}")
+    return diferencias
+
+
+def _libros(carpeta):
+    # Excel que deja el programa: CONTROL y reportes (Data queda afuera, es de cada variante)
+    libros = set()
+    for subcarpeta in ("CONTROL", CARPETA_REPORTES):
+        for root, dirs, files in os.walk(os.path.join(carpeta, subcarpeta)):
+            for file in files:
+                if file.endswith(".xlsx"):
+                    libros.add(os.path.relpath(os.path.join(root, file), carpeta))
+    return libros
+
+
+def comparar_variantes(carpeta_ref, etapas_ref, carpeta_var, etapas_var, tolerancias=(), carpeta_entrada=None):
+    diferencias = []
+    for etapa in ETAPAS:
+        ref, var = etapas_ref[etapa], etapas_var[etapa]
+        if ref["fallo"] != var["fallo"]:
+            diferencias.append(f"{etapa}: fallo {ref['fallo']!r} != {var['fallo']!r}")
+        resultado_ref = None if ref["fallo"] else resultado_referencia(etapa, ref["log"])
+        if resultado_ref != var["resultado"]:
+            diferencias.append(f"{etapa}: resultado {resultado_ref!r} != {var['resultado']!r}")
+        for clave in ("log", "errores"):
+            if ref[clave] == var[clave]:
+                continue
+            if len(ref[clave]) != len(var[clave]):
+                diferencias.append(f"{etapa}: {len(ref[clave])} lineas de {clave} != {len(var[clave])}")
+            for i, (linea_ref, linea_var) in enumerate(zip(ref[clave], var[clave])):
+                if linea_ref != linea_var:
+                    diferencias.append(f"{etapa}: {clave}[{i}] {linea_ref!r} != {linea_var!r}")
+                    break
+
+    libros_ref, libros_var = _libros(carpeta_ref), _libros(carpeta_var)
+    for libro in sorted(libros_ref ^ libros_var):
+        diferencias.append(f"{libro}: solo en {'la referencia' if libro in libros_ref else 'la variante'}")
+    for libro in sorted(libros_ref & libros_var):
+        ruta_entrada = os.path.join(carpeta_entrada, libro) if carpeta_entrada else None
+        diferencias += comparar_libros(os.path.join(carpeta_ref, libro), os.path.join(carpeta_var, libro), libro,
+                                       tolerancias, ruta_entrada)
+    return diferencias
+
+
+# ------------------------------
+# PRUEBA
+# ------------------------------
+def _correr(variante, modo, carpeta, caso, ruta_resultado):
+    entorno = dict(os.environ, CONTROL_ALMACENAMIENTO=modo)
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--ejecutar", variante,
+         "--caso", json.dumps(caso), "--resultado", ruta_resultado],
+        cwd=carpeta, env=entorno, capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        return None, proceso.stderr.strip()
+    with open(ruta_resultado, encoding="utf-8") as f:
+        return json.load(f), None
+
+
+def ejecutar_prueba(casos, semilla, modos, carpeta_trabajo, log_callback=print):
+    fallas = []
+    for i in range(casos):
+        semilla_caso = semilla + i
+        base = os.path.join(carpeta_trabajo, f"caso_{semilla_caso}")
+        shutil.rmtree(base, ignore_errors=True)
+        caso = generar_caso(base, semilla_caso)
+
+        variantes = [("referencia", "excel")] + [("optimizado", modo) for modo in modos]
+        resultados = {}
+        for variante, modo in variantes:
+            carpeta = os.path.join(carpeta_trabajo, f"caso_{semilla_caso}_{variante}_{modo}")
+            shutil.rmtree(carpeta, ignore_errors=True)
+            shutil.copytree(base, carpeta)
+            if variante == "referencia":
+                quitar_estado_entrada(carpeta)
+            etapas, error = _correr(variante, modo, carpeta, caso, carpeta + ".json")
+            if error:
+                fallas.append(f"caso {semilla_caso} ({variante}, {modo}): {error}")
+                break
+            resultados[(variante, modo)] = (carpeta, etapas)
+
+        if len(resultados) == len(variantes):
+            carpeta_ref, etapas_ref = resultados[("referencia", "excel")]
+            for modo in modos:
+                carpeta_var, etapas_var = resultados[("optimizado", modo)]
+                diferencias = comparar_variantes(carpeta_ref, etapas_ref, carpeta_var, etapas_var, TOLERANCIAS[modo], base)
+                estado = "OK" if not diferencias else f"{len(diferencias)} DIFERENCIAS"
+                log_callback(f"[{estado}] caso {semilla_caso} ({caso['descripcion']}), modo {modo}")
+                for diferencia in diferencias[:MAX_DIFERENCIAS]:
+                    log_callback(f"    {diferencia}")
+                if diferencias:
+                    fallas.append(f"caso {semilla_caso}, modo {modo}: {len(diferencias)} diferencias")
+
+        for carpeta, _ in resultados.values():
+            shutil.rmtree(carpeta, ignore_errors=True)
+        shutil.rmtree(base, ignore_errors=True)
+    return fallas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara las versiones rapidas de main.py contra referencia.py")
+    parser.add_argument("--casos", type=int, default=CASOS, help="Cantidad de casos al azar")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla del primer caso (cada caso usa la siguiente)")
+    parser.add_argument("--modos", nargs="+", default=MODOS, choices=MODOS, help="Modos de almacenamiento a comparar")
+    parser.add_argument("--carpeta", help="Carpeta de trabajo; sin ella se usa una temporal que se borra al terminar")
+    parser.add_argument("--ejecutar", choices=["referencia", "optimizado"], help=argparse.SUPPRESS)
+    parser.add_argument("--caso", help=argparse.SUPPRESS)
+    parser.add_argument("--resultado", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Proceso hijo: corre una variante en el directorio actual
+    if args.ejecutar is not None:
+        resultado = ejecutar_variante(args.ejecutar, json.loads(args.caso))
+        with open(args.resultado, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False)
+        sys.exit(0)
+
+    carpeta_trabajo = args.carpeta or tempfile.mkdtemp(prefix="prueba_equivalencia_")
+    os.makedirs(carpeta_trabajo, exist_ok=True)
+    try:
+        fallas = ejecutar_prueba(args.casos, args.semilla, args.modos, carpeta_trabajo)
+    finally:
+        if args.carpeta is None:
+            shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+
+    for falla in fallas:
+        print(f"[ERROR] {falla}")
+    sys.exit(1 if fallas else 0)
@@ -0,0 +1,116 @@
+import os
+import sys
+import shutil
+import argparse
+import subprocess
+import tempfile
+
+
+# ------------------------------
+# PRUEBA DE MARCAR PAGADAS A MANO
+# ------------------------------
+# Arma un CONTROL con una hoja anterior a la columna ESTADO y filas en negrita, corre en su propio
+# proceso (main.py fija sus rutas con os.getcwd()) actualizar_control_manualmente y
+# marcar_pagadas_desde_log, y revisa que cada fila marcada quede entera del color de pagado,
+# centrada, sin negrita y con ESTADO "MANUAL", incluida la primera de la hoja
+ANIO = 2025
+HOJA = "MARZO"
+FILAS = 6
+FILAS_NEGRITA = [3, 5]
+
+ENCABEZADOS_SIN_ESTADO = ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"]
+
+
+def generar_control(base):
+    from openpyxl import Workbook
+    from openpyxl.styles import PatternFill, Font
+
+    from main import COLORES_ESTADO
+
+    rojo = COLORES_ESTADO["NO PAGADO"]
+    wb = Workbook()
+    ws = wb.active
+    ws.title = HOJA
+    ws.append(ENCABEZADOS_SIN_ESTADO)
+    for i in range(2, FILAS + 2):
+        ws.append([f"{i:02d}/03/{ANIO}", f"A{1000 + i}", 100 * i, 0, "-"])
+        for cell in ws[i]:
+            cell.fill = PatternFill(start_color=rojo, end_color=rojo, fill_type="solid")
+            if i in FILAS_NEGRITA:
+                cell.font = Font(bold=True)
+    carpeta = os.path.join(base, "CONTROL", str(ANIO))
+    os.makedirs(carpeta, exist_ok=True)
+    wb.save(os.path.join(carpeta, f"CONTROL_{ANIO}.xlsx"))
+
+
+def marcar():
+    # Proceso hijo: el flujo de la ventana de negritas sobre el CONTROL del directorio actual
+    import main
+
+    log_negrita = main.actualizar_control_manualmente(main.CONTROL_DIR)
+    main.marcar_pagadas_desde_log(log_negrita)
+
+
+def revisar(base):
+    from openpyxl import load_workbook
+
+    from main import COLORES_ESTADO
+
+    verde = COLORES_ESTADO["MANUAL"].upper()
+    fallas = []
+    ws = load_workbook(os.path.join(base, "CONTROL", str(ANIO), f"CONTROL_{ANIO}.xlsx"))[HOJA]
+    encabezados = [cell.value for cell in ws[1]]
+    if "ESTADO" not in encabezados:
+        return [f"la hoja {HOJA} no recibio la columna ESTADO"]
+    col_estado = encabezados.index("ESTADO")
+
+    for row in ws.iter_rows(min_row=2):
+        fila = row[0].row
+        marcada = fila in FILAS_NEGRITA
+        if (row[col_estado].value == "MANUAL") != marcada:
+            fallas.append(f"fila {fila}: ESTADO {row[col_estado].value!r}")
+        if not marcada:
+            continue
+        for cell in row:
+            color = (cell.fill.start_color.rgb or "")[-6:].upper() if cell.fill.fill_type else None
+            if color != verde:
+                fallas.append(f"{cell.coordinate}: relleno {color} en lugar de {verde}")
+            if cell.alignment.horizontal != "center" or cell.alignment.vertical != "center":
+                fallas.append(f"{cell.coordinate}: sin centrar")
+            if cell.font.bold:
+                fallas.append(f"{cell.coordinate}: sigue en negrita")
+    return fallas
+
+
+def ejecutar_prueba(carpeta_trabajo):
+    base = os.path.join(carpeta_trabajo, "caso")
+    shutil.rmtree(base, ignore_errors=True)
+    generar_control(base)
+    proceso = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--marcar"],
+        cwd=base, capture_output=True, text=True
+    )
+    if proceso.returncode != 0:
+        return [f"marcar_pagadas_desde_log fallo: {proceso.stderr.strip()}"]
+    return revisar(base)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Revisa el marcado manual de pagadas en una hoja sin columna ESTADO")
+    parser.add_argument("--marcar", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.marcar:
+        marcar()
+        sys.exit(0)
+
+    carpeta_trabajo = tempfile.mkdtemp(prefix="prueba_marcar_pagadas_")
+    try:
+        fallas = ejecutar_prueba(carpeta_trabajo)
+    finally:
+        shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+
+    for falla in fallas:
+        print(f"[ERROR] {falla}")
+    print("[OK] filas marcadas a mano" if not fallas else f"{len(fallas)} fallas")
+    sys.exit(1 if fallas else 0)
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import math
+import shutil
+import argparse
+import subprocess
+import tempfile
+
+
+# ------------------------------
+# PRUEBA DE MEMORIA POR TAMAÑO
+# ------------------------------
+# Facturas en los CONTROL generados; cada caso se mide en todos los tamaños
+TAMANOS = [5000, 20000, 80000]
+
+# Presupuesto de crecimiento de cada caso: exponente maximo de pico ~ facturas ** exponente
+# entre tamaños consecutivos, para el pico de tracemalloc y para el crecimiento del RSS.
+# 0 = plano (datos ya indexados), 1 = lineal (el caso necesita el libro entero en memoria).
+# Los casos lineales tienen 0.15 de margen para el ruido de la medicion
+PRESUPUESTOS = {
+    # Escaneo en frio: lineal a proposito. Las facturas de cada CONTROL se juntan antes de
+    # guardarlas en el indice, asi que el pico sigue al CONTROL mas grande
+    "FacturasNoPagadas": 1.15,
+    "actualizar_control_manualmente": 1.15,
+    # Con el indice al dia no se abre ningun xlsx: no debe depender del tamaño del archivo
+    "FacturasNoPagadas_sin_cambios": 0.25,
+    "actualizar_control_manualmente_sin_cambios": 0.25,
+    # Abre solo los CONTROL con filas en negrita, pero esos libros se cargan enteros
+    "cancelarcontrolmanual": 1.15,
+}
+
+# Filas en negrita en cada arbol, iguales en todos los tamaños: el resultado de los casos
+# sin cambios (las filas en negrita) no crece con el archivo
+NEGRITAS_POR_ARBOL = 20
+
+# Piso de cada medicion, relativo a la del tamaño mas chico del caso: las bajas por debajo
+# de esa medicion son ruido y no deben contar como crecimiento en el tramo siguiente.
+# RESOLUCION_MB evita dividir por cero (las mediciones se redondean)
+RESOLUCION_MB = {"pico_tracemalloc_mb": 0.05, "rss_crecimiento_mb": 0.5}
+
+
+def _reiniciar_pico_rss():
+    # En Linux el pico de RSS (VmHWM) se puede reiniciar, asi el crecimiento es solo del caso y
+    # no de la preparacion. En otros sistemas el crecimiento es sobre el pico de la preparacion
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_mb():
+    # (RSS actual, pico de RSS) del proceso. El actual solo en Linux; todo None sin resource (Windows)
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            valores = dict(linea.split(":", 1) for linea in f if ":" in linea)
+        return int(valores["VmRSS"].split()[0]) / 1024, int(valores["VmHWM"].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return None, pico / 1048576 if sys.platform == "darwin" else pico / 1024
+
+
+def medir_caso(caso):
+    # Se ejecuta en una copia de la carpeta sintetica; la preparacion queda fuera de la medicion
+    import tracemalloc
+    import main
+
+    if caso == "FacturasNoPagadas":
+        funcion = lambda: main.FacturasNoPagadas(abrir=False)
+    elif caso == "FacturasNoPagadas_sin_cambios":
+        main.FacturasNoPagadas(abrir=False)
+        funcion = lambda: main.FacturasNoPagadas(abrir=False)
+    elif caso == "actualizar_control_manualmente":
+        funcion = lambda: main.actualizar_control_manualmente(main.CONTROL_DIR)
+    elif caso == "actualizar_control_manualmente_sin_cambios":
+        main.actualizar_control_manualmente(main.CONTROL_DIR)
+        funcion = lambda: main.actualizar_control_manualmente(main.CONTROL_DIR)
+    elif caso == "cancelarcontrolmanual":
+        log_negrita = main.actualizar_control_manualmente(main.CONTROL_DIR)
+        funcion = lambda: main.cancelarcontrolmanual(log_negrita)
+    else:
+        raise ValueError(f"Caso desconocido: {caso}")
+
+    reiniciado = _reiniciar_pico_rss()
+    rss_actual, rss_antes = _rss_mb()
+    if reiniciado:
+        rss_antes = rss_actual
+    tracemalloc.start()
+    funcion()
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    rss_despues = _rss_mb()[1]
+    return {
+        "pico_tracemalloc_mb": round(pico / 1048576, 2),
+        "rss_pico_mb": round(rss_despues, 1) if rss_despues is not None else None,
+        "rss_crecimiento_mb": round(rss_despues - rss_antes, 1) if rss_despues is not None else None,
+    }
+
+
+def exponente_crecimiento(mediciones, resolucion):
+    # Mayor exponente entre tamaños consecutivos: log(pico2/pico1) / log(n2/n1),
+    # con la medicion del tamaño mas chico como piso
+    if not mediciones:
+        return None
+    piso = max(mediciones[0][1], resolucion)
+    exponente = None
+    for (n1, pico1), (n2, pico2) in zip(mediciones, mediciones[1:]):
+        pico1, pico2 = max(pico1, piso), max(pico2, piso)
+        tramo = math.log(pico2 / pico1) / math.log(n2 / n1)
+        exponente = tramo if exponente is None else max(exponente, tramo)
+    return exponente
+
+
+def ejecutar_prueba(tamanos, casos, carpeta_trabajo, log_callback=print):
+    from datos_sinteticos import generar_arbol
+
+    resultados = {caso: [] for caso in casos}
+    fallas = []
+    for facturas in tamanos:
+        base = os.path.join(carpeta_trabajo, f"base_{facturas}")
+        shutil.rmtree(base, ignore_errors=True)
+        generar_arbol(base, facturas, proporcion_negrita=NEGRITAS_POR_ARBOL / facturas)
+
+        for caso in casos:
+            # Cada caso en una copia limpia y en su propio proceso, para que el RSS sea solo suyo
+            carpeta = os.path.join(carpeta_trabajo, f"{caso}_{facturas}")
+            shutil.rmtree(carpeta, ignore_errors=True)
+            shutil.copytree(base, carpeta)
+            ruta_resultado = os.path.join(carpeta_trabajo, f"{caso}_{facturas}.json")
+            proceso = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--medir", caso, "--resultado", ruta_resultado],
+                cwd=carpeta, capture_output=True, text=True
+            )
+            shutil.rmtree(carpeta, ignore_errors=True)
+            if proceso.returncode != 0:
+                fallas.append(f"{caso} con {facturas} facturas fallo: {proceso.stderr.strip()}")
+                continue
+            with open(ruta_resultado, encoding="utf-8") as f:
+                medicion = json.load(f)
+            medicion["facturas"] = facturas
+            resultados[caso].append(medicion)
+            log_callback(f"{caso} ({facturas} facturas): {medicion['pico_tracemalloc_mb']} MB pico, "
+                         f"RSS {medicion['rss_pico_mb']} MB (+{medicion['rss_crecimiento_mb']} MB en el caso)")
+        shutil.rmtree(base, ignore_errors=True)
+
+    # Presupuesto de crecimiento, para el pico de tracemalloc y para el crecimiento del RSS
+    for caso, mediciones in resultados.items():
+        presupuesto = PRESUPUESTOS[caso]
+        for medida, resolucion in RESOLUCION_MB.items():
+            puntos = [(m["facturas"], m[medida]) for m in mediciones if m[medida] is not None]
+            exponente = exponente_crecimiento(puntos, resolucion)
+            if exponente is None:
+                continue
+            estado = "OK" if exponente <= presupuesto else "EXCEDIDO"
+            log_callback(f"[{estado}] {caso} ({medida}): crece como n^{exponente:.2f} (presupuesto n^{presupuesto})")
+            if exponente > presupuesto:
+                fallas.append(f"{caso}: {medida} crece como n^{exponente:.2f}, presupuesto n^{presupuesto}")
+    return resultados, fallas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el pico de memoria de cada caso segun el tamaño del archivo")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS, help="Facturas en los CONTROL generados")
+    parser.add_argument("--casos", nargs="+", default=list(PRESUPUESTOS), choices=list(PRESUPUESTOS))
+    parser.add_argument("--salida", help="JSON con las mediciones")
+    parser.add_argument("--medir", help=argparse.SUPPRESS)
+    parser.add_argument("--resultado", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Proceso hijo: mide un caso en el directorio actual
+    if args.medir is not None:
+        resultado = medir_caso(args.medir)
+        with open(args.resultado, "w", encoding="utf-8") as f:
+            json.dump(resultado, f)
+        sys.exit(0)
+
+    if len(args.tamanos) < 2:
+        parser.error("hacen falta al menos dos tamaños para medir el crecimiento")
+
+    carpeta_trabajo = tempfile.mkdtemp(prefix="prueba_memoria_")
+    try:
+        resultados, fallas = ejecutar_prueba(sorted(args.tamanos), args.casos, carpeta_trabajo)
+    finally:
+        shutil.rmtree(carpeta_trabajo, ignore_errors=True)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"resultados": resultados, "fallas": fallas, "presupuestos": PRESUPUESTOS}, f, indent=2)
+
+    for falla in fallas:
+        print(f"[ERROR] {falla}")
+    sys.exit(1 if fallas else 0)
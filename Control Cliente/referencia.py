@@ -0,0 +1,315 @@
+import os
+import locale
+import calendar
+import pandas as pd
+
+from openpyxl import load_workbook, Workbook
+from openpyxl.styles import PatternFill, Alignment
+
+
+# ------------------------------
+# IMPLEMENTACION DE REFERENCIA
+# ------------------------------
+# agregar_pago, agregar_control y FacturasNoPagadas copiadas sin cambios de la version original
+# de main.py (commit 329bbf2), con las rutas, MESES_ES, default_log y obtener_ruta_control_por_anio
+# de esa misma version. No se usan en el programa ni importan nada de main.py: son el comportamiento
+# de partida contra el que prueba_equivalencia.py compara las versiones rapidas. Los cambios de
+# comportamiento pedidos despues (columna ESTADO, anchos que solo crecen, resultados en diccionario)
+# no se agregan aca, se declaran como normalizaciones en prueba_equivalencia.py.
+BASE_DIR = os.getcwd()  
+CONTROL_DIR = os.path.join(BASE_DIR, "CONTROL")
+OUTPUT_FILE_FACTURASNOPAGADAS = os.path.join(BASE_DIR, "FacturasNoPagadas", "FacturasNoPagadas.xlsx")
+
+
+# Diccionario para traducir meses a español
+MESES_ES = {
+    1: "ENERO", 2: "FEBRERO", 3: "MARZO", 4: "ABRIL",
+    5: "MAYO", 6: "JUNIO", 7: "JULIO", 8: "AGOSTO",
+    9: "SEPTIEMBRE", 10: "OCTUBRE", 11: "NOVIEMBRE", 12: "DICIEMBRE"
+}
+
+
+def default_log(msg):
+    print(msg)
+
+
+def obtener_ruta_control_por_anio(anio):
+    carpeta_anio = os.path.join("CONTROL", str(anio))
+    os.makedirs(carpeta_anio, exist_ok=True)
+    ruta_archivo = os.path.join(carpeta_anio, f"CONTROL_{anio}.xlsx")
+
+    return ruta_archivo
+
+
+def agregar_pago(nuevo_destino, log_callback=None, errores_detallados=None, log_completo=None):
+    log_callback = log_callback or default_log
+    errores_detallados = errores_detallados or []
+    log_completo = log_completo or []
+
+    def log_wrapper(mensaje):
+        log_callback(mensaje)
+        log_completo.append(mensaje)
+
+    # Fuerzo que las columnas FECHA y FECHA PAGO se lean como texto para evitar errores
+    df_pago = pd.read_excel(nuevo_destino, dtype={"FECHA": str, "FECHA PAGO": str})
+    df_pago.columns = [col.strip().upper() for col in df_pago.columns]
+
+    for col in ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"]:
+        if col not in df_pago.columns:
+            raise KeyError(f"El archivo de pago no tiene la columna {col}")
+
+    color_pagado = PatternFill(start_color="93c47d", end_color="93c47d", fill_type="solid")
+    color_diferencia = PatternFill(start_color="f6b26b", end_color="f6b26b", fill_type="solid")
+
+    log_wrapper(f"\n{'-'*60}\nProcesando archivo de pago: {nuevo_destino}\n{'-'*60}\n")
+
+    for _, fila in df_pago.iterrows():
+        # Convierto a datetime usando dayfirst=True para asegurar dd/mm/yyyy
+        fecha = pd.to_datetime(fila["FECHA"], dayfirst=True, errors="coerce")
+        if pd.isna(fecha):
+            log_wrapper(f"[ERROR] Fecha inválida en fila: {fila}")
+            continue
+
+        anio = fecha.year
+        mes_nombre = MESES_ES.get(fecha.month, None)
+        if not mes_nombre:
+            log_wrapper(f"[ERROR] Mes inválido para fecha {fecha}")
+            continue
+
+        numero = fila["NUMERO"]
+        monto_base = fila["MONTO"]
+        monto_pagado = fila["PAGADO"]
+        fecha_pago_val = fila["FECHA PAGO"]
+
+        archivo_control = obtener_ruta_control_por_anio(anio)
+
+        if not os.path.exists(archivo_control):
+            descripcion = f"Archivo CONTROL para año {anio} no encontrado"
+            errores_detallados.append({
+                "archivo": nuevo_destino,
+                "tipo": "Pago",
+                "numero": numero,
+                "fecha": fecha.strftime("%d/%m/%Y"),
+                "descripcion": descripcion
+            })
+            log_wrapper(f"[ERROR] {descripcion}")
+            continue
+
+        wb = load_workbook(archivo_control)
+
+        if mes_nombre not in wb.sheetnames:
+            descripcion = f"Hoja {mes_nombre} no existe en archivo CONTROL {anio}"
+            errores_detallados.append({
+                "archivo": nuevo_destino,
+                "tipo": "Pago",
+                "numero": numero,
+                "fecha": fecha.strftime("%d/%m/%Y"),
+                "descripcion": descripcion
+            })
+            log_wrapper(f"[ERROR] {descripcion}")
+            continue
+
+        ws = wb[mes_nombre]
+        encontrado = False
+
+        for row in ws.iter_rows(min_row=2):
+            cell_numero = row[1].value
+            if str(cell_numero) == str(numero):
+                encontrado = True
+                try:
+                    monto_base_float = float(monto_base)
+                    monto_pagado_float = float(monto_pagado)
+                except (ValueError, TypeError):
+                    log_wrapper(f"[ERROR] Monto inválido en fila: {fila}")
+                    continue
+
+                diferencia = abs(monto_base_float - monto_pagado_float)
+                porcentaje_diferencia = diferencia / abs(monto_base_float) if monto_base_float != 0 else 0
+
+                if (
+                    monto_base_float == monto_pagado_float or
+                    abs(porcentaje_diferencia - 0.22) < 0.01 or
+                    abs(porcentaje_diferencia - 0.10) < 0.01
+                ):
+                    fill_color = color_pagado
+                else:
+                    fill_color = color_diferencia
+
+
+                for cell in row:
+                    cell.fill = fill_color
+                row[3].value = monto_pagado
+                row[4].value = fecha_pago_val
+                log_wrapper(f"Fila actualizada en CONTROL {anio}: Número {numero}, Fecha {fecha.strftime('%d/%m/%Y')}")
+                break
+
+        if not encontrado:
+            descripcion = f"Número {numero} con monto {monto_base} no encontrado en hoja {mes_nombre} del CONTROL {anio}"
+            errores_detallados.append({
+                "archivo": nuevo_destino,
+                "tipo": "Pago",
+                "numero": numero,
+                "fecha": fecha.strftime("%d/%m/%Y"),
+                "descripcion": descripcion
+            })
+            log_wrapper(f"[ERROR] {descripcion}")
+
+        wb.save(archivo_control)
+
+
+def agregar_control(archivo_control, archivo_agregar, log_callback=None, errores_detallados=None, log_completo=None):
+    log_callback = log_callback or default_log
+    errores_detallados = errores_detallados or []
+    log_completo = log_completo or []
+
+    def log_wrapper(mensaje):
+        log_callback(mensaje)
+        log_completo.append(mensaje)
+
+    df_agregar = pd.read_excel(archivo_agregar)
+    wb = load_workbook(archivo_control)
+    filas_agregadas = 0
+    filas_omitidas = 0
+
+    for idx, fila in df_agregar.iterrows():
+        fecha = pd.to_datetime(fila["FECHA"], dayfirst=True)
+        locale.setlocale(locale.LC_TIME, "es_ES.UTF-8")
+        mes_nombre = calendar.month_name[fecha.month].upper()
+
+        if mes_nombre not in wb.sheetnames:
+            ws = wb.create_sheet(title=mes_nombre)
+            ws.append(["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHA PAGO"])
+        else:
+            ws = wb[mes_nombre]
+
+        numeros_existentes = [str(cell.value) for cell in ws["B"][1:]]
+        if str(fila["NUMERO"]) in numeros_existentes:
+            filas_omitidas += 1
+            errores_detallados.append({
+                "archivo": archivo_agregar,
+                "tipo": "Control",
+                "numero": fila["NUMERO"],
+                "fecha": fecha.strftime("%d/%m/%Y"),
+                "descripcion": "Número duplicado, fila omitida"
+            })
+            log_wrapper(f"[ERROR] Archivo: {archivo_agregar}, Número duplicado: {fila['NUMERO']}, Fecha: {fecha.strftime('%d/%m/%Y')}")
+            continue
+
+        nueva_fila = [
+            fecha.strftime("%d/%m/%Y"),
+            fila["NUMERO"],
+            fila["MONTO"],
+            0,
+            "-"
+        ]
+        ws.append(nueva_fila)
+        filas_agregadas += 1
+        log_wrapper(f"Fila agregada: Número {fila['NUMERO']}, Fecha {fecha.strftime('%d/%m/%Y')}")
+
+        fill = PatternFill(start_color="FF4040", end_color="FF4040", fill_type="solid")
+        for cell in ws[ws.max_row]:
+            cell.fill = fill
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+
+    for ws_iter in wb.worksheets:
+        for col in ws_iter.columns:
+            max_length = 0
+            col_letter = col[0].column_letter
+            for cell in col:
+                if cell.value is not None:
+                    max_length = max(max_length, len(str(cell.value)))
+                cell.alignment = Alignment(horizontal="center", vertical="center")
+            ws_iter.column_dimensions[col_letter].width = max_length + 8
+        for cell in ws_iter[1]:
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+
+    # Elimina la hoja temporal
+    if "TEMP" in wb.sheetnames and len(wb.sheetnames) > 1:
+        std = wb["TEMP"]
+        wb.remove(std)
+
+    wb.save(archivo_control)
+    log_wrapper(f"Archivo CONTROL actualizado: {filas_agregadas} filas agregadas, {filas_omitidas} filas omitidas.")
+
+
+def FacturasNoPagadas():
+
+    color_diferencia = PatternFill(start_color="F6B26B", end_color="F6B26B", fill_type="solid")
+    color_rojo = PatternFill(start_color="FF4040", end_color="FF4040", fill_type="solid")
+
+    wb_out = Workbook()
+    ws_out = wb_out.active
+    ws_out.title = "NoPagadas"
+
+    # Encabezado
+    encabezado = ["FECHA", "NUMERO", "MONTO", "PAGADO", "FECHAPAGO", "DIFERENCIA", "PORCENTAJE"]
+    ws_out.append(encabezado)
+    for idx, _ in enumerate(encabezado, start=1):
+        ws_out.cell(row=1, column=idx).alignment = Alignment(horizontal="center", vertical="center")
+
+    # Recorrer archivos CONTROL_
+    for root, dirs, files in os.walk(CONTROL_DIR):
+        for file in files:
+            if file.endswith(".xlsx") and file.startswith("CONTROL_"):
+                ruta = os.path.join(root, file)
+                wb = load_workbook(ruta)
+                for ws in wb.worksheets:
+                    # Detectar indice de columnas dinamicamente
+                    ws_headers = [cell.value.strip().upper() if isinstance(cell.value, str) else "" for cell in ws[1]]
+                    try:
+                        fecha_idx = ws_headers.index("FECHA")
+                        monto_idx = ws_headers.index("MONTO")
+                        pagado_idx = ws_headers.index("PAGADO")
+                    except ValueError:
+                        continue  # Si no encuentra columnas requeridas, pasa a la siguiente hoja
+
+                    for row in ws.iter_rows(min_row=2, values_only=False):
+                        fecha_cell = row[fecha_idx]
+                        fill_color = fecha_cell.fill.start_color.rgb
+                        if fill_color:
+                            fill_color = fill_color[-6:].upper()
+                        else:
+                            continue
+
+                        if fill_color in ["F6B26B", "FF4040"]:
+                            # Obtener valores
+                            monto = row[monto_idx].value or 0
+                            pagado = row[pagado_idx].value or 0
+                            diferencia = None
+                            porcentaje = None
+
+                            if fill_color == "F6B26B":  
+                                diferencia = monto - pagado
+                                if monto != 0:
+                                    porcentaje_val = (diferencia / monto) * 100
+                                    porcentaje = f"%{round(porcentaje_val, 2)}"
+                                else:
+                                    porcentaje = "%0.00"
+
+                            # Copiar fila
+                            nueva_fila = [cell.value for cell in row]
+                            nueva_fila.extend([diferencia, porcentaje])
+                            ws_out.append(nueva_fila)
+
+                            # Aplicar color y centrar
+                            row_out_idx = ws_out.max_row
+                            for col_idx in range(1, len(nueva_fila) + 1):
+                                cell_out = ws_out.cell(row=row_out_idx, column=col_idx)
+                                if fill_color == "F6B26B":
+                                    cell_out.fill = color_diferencia
+                                else:
+                                    cell_out.fill = color_rojo
+                                cell_out.alignment = Alignment(horizontal="center", vertical="center")
+
+    # Ajustar ancho de columnas
+    for col in ws_out.columns:
+        max_length = 0
+        col_letter = col[0].column_letter
+        for cell in col:
+            if cell.value is not None:
+                max_length = max(max_length, len(str(cell.value)))
+        ws_out.column_dimensions[col_letter].width = max_length + 8
+
+    os.makedirs(os.path.dirname(OUTPUT_FILE_FACTURASNOPAGADAS), exist_ok=True)
+    wb_out.save(OUTPUT_FILE_FACTURASNOPAGADAS)
+    os.startfile(OUTPUT_FILE_FACTURASNOPAGADAS)